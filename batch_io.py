@@ -0,0 +1,116 @@
+""" Batched datagram I/O shared by the sender and the receiver """
+
+import errno
+import socket
+import struct
+import sys
+
+from protocol import RECV_BUFFER_SIZE
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+def enlarge_socket_buffers(sock, size=SOCKET_BUFFER_SIZE):
+    """ Asks the kernel for larger socket buffers so a burst is not dropped before it is drained """
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError:
+            pass
+
+class BatchReceiver:
+    """ Drains every pending datagram per wakeup into preallocated buffers with recvmsg_into.
+
+    The returned memoryviews point into buffers that are reused by the next receive_batch()
+    call, so callers must copy any payload they keep.
+    """
+
+    def __init__(self, sock, batch_size=64, buffer_size=RECV_BUFFER_SIZE):
+        self.sock = sock
+        self.buffers = [bytearray(buffer_size) for _ in range(batch_size)]
+        self.views = [memoryview(buffer) for buffer in self.buffers]
+        self.use_recvmsg_into = hasattr(sock, "recvmsg_into")
+
+    def receive_batch(self):
+        """ Returns a list of (datagram, address) pairs from a non-blocking socket, possibly empty """
+        datagrams = []
+        for view in self.views:
+            try:
+                if self.use_recvmsg_into:
+                    nbytes, _, _, address = self.sock.recvmsg_into([view])
+                else:
+                    nbytes, address = self.sock.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+            datagrams.append((view[:nbytes], address))
+        return datagrams
+
+class BatchSender:
+    """ Sends a burst of (header, payload) datagrams with as few syscalls as possible.
+
+    On Linux, runs of equally sized datagrams are handed to the kernel as one UDP_SEGMENT
+    (GSO) super-datagram built from a gather list, so headers and payloads are still never
+    concatenated in Python. Elsewhere, or if the kernel rejects GSO, each datagram is sent
+    with its own sendmsg call.
+    """
+
+    def __init__(self, sock, use_gso=None):
+        self.sock = sock
+        self.use_sendmsg = hasattr(sock, "sendmsg")
+        if use_gso is None:
+            use_gso = sys.platform.startswith("linux")
+        self.use_gso = use_gso and self.use_sendmsg
+        self.number_of_send_calls = 0
+
+    def send_one(self, header, payload, address):
+        self.number_of_send_calls += 1
+        if self.use_sendmsg:
+            self.sock.sendmsg([header, payload], [], 0, address)
+        else:
+            self.sock.sendto(header + payload, address)
+
+    def send_burst(self, datagrams, address):
+        """ Sends a list of (header, payload) pairs to one address, in order """
+        index = 0
+        while index < len(datagrams):
+            run = self.gso_run_length(datagrams, index) if self.use_gso else 1
+            if run > 1 and self.send_gso(datagrams[index:index + run], address):
+                index += run
+                continue
+            header, payload = datagrams[index]
+            self.send_one(header, payload, address)
+            index += 1
+
+    def gso_run_length(self, datagrams, start):
+        """ Number of datagrams from start that can share one GSO send: equal sizes, last may be shorter """
+        segment_size = len(datagrams[start][0]) + len(datagrams[start][1])
+        total = 0
+        run = 0
+        for header, payload in datagrams[start:start + GSO_MAX_SEGMENTS]:
+            size = len(header) + len(payload)
+            if size > segment_size or total + size > GSO_MAX_BYTES:
+                break
+            total += size
+            run += 1
+            if size < segment_size:
+                break
+        return run
+
+    def send_gso(self, datagrams, address):
+        segment_size = len(datagrams[0][0]) + len(datagrams[0][1])
+        buffers = []
+        for header, payload in datagrams:
+            buffers.append(header)
+            buffers.append(payload)
+        try:
+            self.sock.sendmsg(buffers, [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', segment_size))], 0, address)
+        except OSError as error:
+            if error.errno not in (errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP, errno.EMSGSIZE):
+                raise
+            self.use_gso = False
+            return False
+        self.number_of_send_calls += 1
+        return True
@@ -0,0 +1,97 @@
+""" Packets-per-second comparison of per-datagram sendto/recvfrom against the batch_io layer.
+
+Usage: python benchmarks/bench_batch_io.py [--packets N] [--burst B] [--payload BYTES]
+"""
+
+import argparse
+import os
+import selectors
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_io import BatchReceiver, BatchSender, enlarge_socket_buffers
+from protocol import DATA, RECV_BUFFER_SIZE, V2
+
+def open_pair():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('localhost', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind(('localhost', 0))
+    for sock in (receiver, sender):
+        enlarge_socket_buffers(sock)
+    receiver.setblocking(False)
+    return sender, receiver
+
+def wait_readable(selector):
+    if not selector.select(1.0):
+        raise RuntimeError("datagrams were lost on loopback; lower --burst")
+
+def run_unbatched(packets, burst, payload):
+    sender, receiver = open_pair()
+    selector = selectors.DefaultSelector()
+    selector.register(receiver, selectors.EVENT_READ)
+    address = receiver.getsockname()
+    started = time.perf_counter()
+    for first in range(0, packets, burst):
+        count = min(burst, packets - first)
+        for seq_number in range(first, first + count):
+            sender.sendto(V2.pack(DATA, seq_number) + payload, address)
+        received = 0
+        while received < count:
+            wait_readable(selector)
+            while received < count:
+                try:
+                    receiver.recvfrom(RECV_BUFFER_SIZE)
+                except BlockingIOError:
+                    break
+                received += 1
+    elapsed = time.perf_counter() - started
+    selector.close()
+    sender.close()
+    receiver.close()
+    return elapsed, packets
+
+def run_batched(packets, burst, payload, use_gso):
+    sender, receiver = open_pair()
+    batch_sender = BatchSender(sender, use_gso=use_gso)
+    batch_receiver = BatchReceiver(receiver)
+    selector = selectors.DefaultSelector()
+    selector.register(receiver, selectors.EVENT_READ)
+    address = receiver.getsockname()
+    payload_view = memoryview(payload)
+    started = time.perf_counter()
+    for first in range(0, packets, burst):
+        count = min(burst, packets - first)
+        batch_sender.send_burst([(V2.pack(DATA, seq_number), payload_view) for seq_number in range(first, first + count)], address)
+        received = 0
+        while received < count:
+            wait_readable(selector)
+            received += len(batch_receiver.receive_batch())
+    elapsed = time.perf_counter() - started
+    selector.close()
+    sender.close()
+    receiver.close()
+    return elapsed, batch_sender.number_of_send_calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packets", type=int, default=200000)
+    parser.add_argument("--burst", type=int, default=64)
+    parser.add_argument("--payload", type=int, default=1000)
+    args = parser.parse_args()
+    payload = os.urandom(args.payload)
+
+    baseline_time, baseline_calls = run_unbatched(args.packets, args.burst, payload)
+    baseline_pps = args.packets / baseline_time
+    print(f"{'mode':<22}{'packets/s':>14}{'send calls':>12}{'gain':>9}")
+    print(f"{'sendto/recvfrom':<22}{baseline_pps:>14.0f}{baseline_calls:>12}{1.0:>8.2f}x")
+    for label, use_gso in (("batched", False), ("batched + UDP GSO", True)):
+        elapsed, calls = run_batched(args.packets, args.burst, payload, use_gso)
+        pps = args.packets / elapsed
+        print(f"{label:<22}{pps:>14.0f}{calls:>12}{pps / baseline_pps:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+""" End-to-end transfer benchmark: runs sender.py and receiver.py over loopback for a parameter matrix.
+
+Every run records goodput, completion time, retransmission ratio, and the CPU time and peak RSS
+of each process (from wait4 rusage). The completion time is the sender's own SYN-to-FIN-ACK time
+from its log summary, so interpreter start-up is not counted. Results go to JSON and/or CSV; with
+--baseline the medians of each configuration are compared against a stored JSON result and
+regressions beyond the run-to-run spread fail the run.
+
+Usage: python benchmarks/bench_transfer.py [--sizes 100000,1000000] [--windows 50000] [--rtos 50]
+           [--flp 0,0.05] [--rlp 0,0.05] [--repeat 5] [--json out.json] [--csv out.csv] [--baseline base.json]
+"""
+
+import argparse
+import csv
+import filecmp
+import itertools
+import json
+import os
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIGURATION_FIELDS = ("size", "max_win", "rto", "flp", "rlp")
+RESULT_FIELDS = CONFIGURATION_FIELDS + ("run", "ok", "completion_time", "process_time", "goodput", "retransmission_ratio",
+                                        "original_segments", "retransmitted_segments", "sender_cpu", "receiver_cpu",
+                                        "sender_max_rss_kb", "receiver_max_rss_kb")
+
+def free_ports(count):
+    """ Ports the kernel just handed out, released again so the endpoints can bind them """
+    sockets = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('localhost', 0))
+        sockets.append(sock)
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+class ProcessWaiter:
+    """ Reaps a child with wait4 on a background thread, so exit time and rusage are exact """
+
+    def __init__(self, process):
+        self.process = process
+        self.exited_at = None
+        self.status = None
+        self.rusage = None
+        self.thread = threading.Thread(target=self.wait, daemon=True)
+        self.thread.start()
+
+    def wait(self):
+        _, self.status, self.rusage = os.wait4(self.process.pid, 0)
+        self.exited_at = time.perf_counter()
+        self.process.returncode = os.waitstatus_to_exitcode(self.status)
+
+    def join(self, timeout):
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self.process.kill()
+            self.thread.join()
+            return False
+        return self.process.returncode == 0
+
+    @property
+    def cpu_time(self):
+        return self.rusage.ru_utime + self.rusage.ru_stime
+
+def read_summary(log_filename):
+    """ The 'Name: value' lines written at the end of a log """
+    summary = {}
+    with open(log_filename) as file:
+        for line in file:
+            name, separator, value = line.rpartition(":")
+            if separator:
+                summary[name.strip()] = value.strip()
+    return summary
+
+def run_transfer(configuration, run, args):
+    size, max_win, rto, flp, rlp = (configuration[field] for field in CONFIGURATION_FIELDS)
+    with tempfile.TemporaryDirectory(prefix="bench_transfer_") as directory:
+        input_filename = os.path.join(directory, "input.bin")
+        output_filename = os.path.join(directory, "output.bin")
+        with open(input_filename, 'wb') as file:
+            file.write(os.urandom(size))
+        sender_port, receiver_port = free_ports(2)
+        seed = [] if args.seed is None else ["--seed", str(args.seed + run)]
+
+        receiver = subprocess.Popen([sys.executable, os.path.join(PACKAGE_DIRECTORY, "receiver.py"), str(receiver_port),
+                                     str(sender_port), output_filename, str(max_win), "--log-mode", "counters"]
+                                    + shlex.split(args.receiver_args), cwd=directory, stdout=subprocess.DEVNULL)
+        receiver_waiter = ProcessWaiter(receiver)
+        time.sleep(args.startup_delay)
+
+        started = time.perf_counter()
+        sender = subprocess.Popen([sys.executable, os.path.join(PACKAGE_DIRECTORY, "sender.py"), str(sender_port),
+                                   str(receiver_port), input_filename, str(max_win), str(rto), str(flp), str(rlp),
+                                   "--log-mode", "counters"] + seed + shlex.split(args.sender_args),
+                                  cwd=directory, stdout=subprocess.DEVNULL)
+        sender_waiter = ProcessWaiter(sender)
+        sender_ok = sender_waiter.join(args.timeout)
+        receiver_ok = receiver_waiter.join(max(1.0, args.timeout - (time.perf_counter() - started)))
+
+        ok = sender_ok and receiver_ok and filecmp.cmp(input_filename, output_filename, shallow=False)
+        process_time = sender_waiter.exited_at - started
+        summary = read_summary(os.path.join(directory, "sender_log.txt")) if sender_ok else {}
+        completion_time = float(summary.get("Transfer time (s)", process_time))
+        original_segments = int(summary.get("Original segments sent", 0))
+        retransmitted_segments = int(summary.get("Retransmitted segments", 0))
+        return {
+            **configuration,
+            "run": run,
+            "ok": ok,
+            "completion_time": round(completion_time, 6),
+            "process_time": round(process_time, 6),
+            "goodput": round(size / completion_time, 1) if ok else 0.0,
+            "retransmission_ratio": round(retransmitted_segments / original_segments, 6) if original_segments else 0.0,
+            "original_segments": original_segments,
+            "retransmitted_segments": retransmitted_segments,
+            "sender_cpu": round(sender_waiter.cpu_time, 6),
+            "receiver_cpu": round(receiver_waiter.cpu_time, 6),
+            "sender_max_rss_kb": sender_waiter.rusage.ru_maxrss,
+            "receiver_max_rss_kb": receiver_waiter.rusage.ru_maxrss,
+        }
+
+def configuration_key(result):
+    return tuple(result[field] for field in CONFIGURATION_FIELDS)
+
+def relative_spread(values):
+    """ Median absolute deviation as a fraction of the median; 0 for a single run """
+    median = statistics.median(values)
+    if not median:
+        return 0.0
+    return statistics.median(abs(value - median) for value in values) / median
+
+def medians(results):
+    """ Median goodput and CPU time per configuration over the successful runs, with their relative spread """
+    grouped = {}
+    for result in results:
+        if result["ok"]:
+            grouped.setdefault(configuration_key(result), []).append(result)
+    summaries = {}
+    for key, runs in grouped.items():
+        goodputs = [run["goodput"] for run in runs]
+        cpus = [run["sender_cpu"] + run["receiver_cpu"] for run in runs]
+        summaries[key] = {"goodput": statistics.median(goodputs), "goodput_spread": relative_spread(goodputs),
+                          "cpu": statistics.median(cpus), "cpu_spread": relative_spread(cpus)}
+    return summaries
+
+def compare_with_baseline(results, baseline, tolerance, spreads):
+    """ Prints each configuration against the baseline; returns the list of regressed configurations.
+
+    A change counts as a regression when it exceeds both tolerance and spreads times the larger
+    relative spread of the two result sets, so noisy configurations need a larger change to fail.
+    """
+    current = medians(results)
+    previous = medians(baseline)
+    regressions = []
+    print(f"{'size':>10}{'max_win':>9}{'rto':>6}{'flp':>6}{'rlp':>6}{'goodput':>10}{'limit':>8}{'cpu':>9}{'limit':>8}")
+    for key, measured in sorted(current.items()):
+        if key not in previous:
+            continue
+        goodput_change = measured["goodput"] / previous[key]["goodput"] - 1 if previous[key]["goodput"] else 0.0
+        cpu_change = measured["cpu"] / previous[key]["cpu"] - 1 if previous[key]["cpu"] else 0.0
+        goodput_limit = max(tolerance, spreads * max(measured["goodput_spread"], previous[key]["goodput_spread"]))
+        cpu_limit = max(tolerance, spreads * max(measured["cpu_spread"], previous[key]["cpu_spread"]))
+        regressed = goodput_change < -goodput_limit or cpu_change > cpu_limit
+        print(f"{key[0]:>10}{key[1]:>9}{key[2]:>6}{key[3]:>6}{key[4]:>6}{goodput_change:>+10.1%}{goodput_limit:>8.1%}"
+              f"{cpu_change:>+9.1%}{cpu_limit:>8.1%}" + ("  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+def parse_list(text, type):
+    return [type(value) for value in text.split(",") if value]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100000,1000000", help="comma-separated file sizes in bytes")
+    parser.add_argument("--windows", default="50000", help="comma-separated max_win values")
+    parser.add_argument("--rtos", default="50", help="comma-separated rto values in ms")
+    parser.add_argument("--flp", default="0,0.05", help="comma-separated forward loss probabilities")
+    parser.add_argument("--rlp", default="0,0.05", help="comma-separated reverse loss probabilities")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per configuration")
+    parser.add_argument("--seed", type=int, help="seed for the sender's impairment layer, offset by the run index")
+    parser.add_argument("--sender-args", default="", help="extra sender.py options, e.g. \"--cc cubic\"")
+    parser.add_argument("--receiver-args", default="", help="extra receiver.py options")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before a run is killed and marked failed")
+    parser.add_argument("--startup-delay", type=float, default=0.2, help="seconds between starting the receiver and the sender")
+    parser.add_argument("--json", help="write every run as JSON")
+    parser.add_argument("--csv", help="write every run as CSV")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative goodput drop or CPU increase that counts as a regression")
+    parser.add_argument("--spreads", type=float, default=3.0,
+                        help="a regression must also exceed this many relative median absolute deviations of the runs")
+    args = parser.parse_args()
+
+    matrix = itertools.product(parse_list(args.sizes, int), parse_list(args.windows, int), parse_list(args.rtos, int),
+                               parse_list(args.flp, float), parse_list(args.rlp, float))
+    results = []
+    print(f"{'size':>10}{'max_win':>9}{'rto':>6}{'flp':>6}{'rlp':>6}{'run':>4}{'ok':>4}{'time s':>9}{'MB/s':>8}"
+          f"{'retx':>7}{'snd cpu':>9}{'rcv cpu':>9}{'snd KB':>8}{'rcv KB':>8}")
+    for values in matrix:
+        configuration = dict(zip(CONFIGURATION_FIELDS, values))
+        for run in range(args.repeat):
+            result = run_transfer(configuration, run, args)
+            results.append(result)
+            print(f"{result['size']:>10}{result['max_win']:>9}{result['rto']:>6}{result['flp']:>6}{result['rlp']:>6}"
+                  f"{run:>4}{'yes' if result['ok'] else 'NO':>4}{result['completion_time']:>9.3f}"
+                  f"{result['goodput'] / 1e6:>8.2f}{result['retransmission_ratio']:>7.3f}{result['sender_cpu']:>9.3f}"
+                  f"{result['receiver_cpu']:>9.3f}{result['sender_max_rss_kb']:>8}{result['receiver_max_rss_kb']:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+    failed = [result for result in results if not result["ok"]]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_with_baseline(results, json.load(file), args.tolerance, args.spreads)
+    if failed or regressions:
+        print(f"{len(failed)} failed runs, {len(regressions)} regressed configurations")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
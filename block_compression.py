@@ -0,0 +1,140 @@
+""" Block compression of the DATA stream, negotiated in the SYN.
+
+The sender cuts the file into blocks, compresses each one on its own and frames it with a
+5-byte header: a kind byte (stored or compressed) and the framed length. A block that does
+not shrink is stored as it is. The framed stream is then cut into full MSS segments like an
+uncompressed file, so frames span segment boundaries and the receiver reassembles them from
+the in-order byte stream before decompressing. zstd is used when the `zstandard` package is
+installed on both ends, zlib otherwise.
+"""
+
+import struct
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = 1
+ZSTD = 2
+ALGORITHM_NAMES = {ZLIB: "zlib", ZSTD: "zstd"}
+
+STORED = 0
+COMPRESSED = 1
+FRAME_LAYOUT = struct.Struct('!BI')
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+def supported_algorithms():
+    """ Algorithm ids available in this process, most preferred first """
+    return [ZSTD, ZLIB] if zstandard is not None else [ZLIB]
+
+def choose_algorithm(offered):
+    """ The first offered algorithm this process supports, or None """
+    supported = supported_algorithms()
+    for algorithm in offered:
+        if algorithm in supported:
+            return algorithm
+    return None
+
+class BlockCompressor:
+    """ Reads a file view as a stream of framed blocks, compressing each block when it is first needed """
+
+    def __init__(self, view, algorithm, level=1, block_size=DEFAULT_BLOCK_SIZE):
+        self.view = view
+        self.algorithm = algorithm
+        self.level = level
+        self.block_size = block_size
+        if algorithm == ZSTD:
+            self.compress = zstandard.ZstdCompressor(level=level).compress
+        else:
+            self.compress = lambda block: zlib.compress(block, level)
+        self.position = 0
+        self.pending = bytearray()
+        self.number_of_blocks = 0
+        self.number_of_stored_blocks = 0
+        self.amount_of_input_in_bytes = 0
+        self.amount_of_output_in_bytes = 0
+        self.cpu_time = 0.0
+
+    @property
+    def finished(self):
+        return self.position >= len(self.view) and not self.pending
+
+    def compress_next_block(self):
+        block = self.view[self.position:self.position + self.block_size]
+        self.position += len(block)
+        started = time.process_time()
+        compressed = self.compress(block)
+        self.cpu_time += time.process_time() - started
+        if len(compressed) < len(block):
+            self.pending += FRAME_LAYOUT.pack(COMPRESSED, len(compressed))
+            self.pending += compressed
+        else:
+            self.pending += FRAME_LAYOUT.pack(STORED, len(block))
+            self.pending += block
+            self.number_of_stored_blocks += 1
+        self.number_of_blocks += 1
+        self.amount_of_input_in_bytes += len(block)
+        self.amount_of_output_in_bytes += FRAME_LAYOUT.size + min(len(compressed), len(block))
+
+    def read(self, size):
+        """ Up to size bytes of the framed stream; shorter only at its end """
+        while len(self.pending) < size and self.position < len(self.view):
+            self.compress_next_block()
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    @property
+    def ratio(self):
+        return self.amount_of_input_in_bytes / self.amount_of_output_in_bytes if self.amount_of_output_in_bytes else 1.0
+
+class FrameDecoder:
+    """ Reassembles frames from in-order stream bytes and returns their decompressed contents.
+
+    Raises ValueError for an unknown frame kind or a block that does not decompress.
+    """
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        if algorithm == ZSTD:
+            self.decompressor = zstandard.ZstdDecompressor()
+        self.buffer = bytearray()
+        self.amount_of_input_in_bytes = 0
+        self.amount_of_output_in_bytes = 0
+        self.cpu_time = 0.0
+
+    @property
+    def partial_frame(self):
+        return bool(self.buffer)
+
+    def decompress(self, block):
+        if self.algorithm == ZSTD:
+            return self.decompressor.decompressobj().decompress(block)
+        return zlib.decompress(block)
+
+    def feed(self, data):
+        self.buffer += data
+        self.amount_of_input_in_bytes += len(data)
+        blocks = []
+        while len(self.buffer) >= FRAME_LAYOUT.size:
+            kind, length = FRAME_LAYOUT.unpack_from(self.buffer)
+            end = FRAME_LAYOUT.size + length
+            if len(self.buffer) < end:
+                break
+            block = bytes(self.buffer[FRAME_LAYOUT.size:end])
+            del self.buffer[:end]
+            if kind == COMPRESSED:
+                started = time.process_time()
+                try:
+                    block = self.decompress(block)
+                except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as error:
+                    raise ValueError(f"corrupt {ALGORITHM_NAMES[self.algorithm]} block: {error}") from None
+                self.cpu_time += time.process_time() - started
+            elif kind != STORED:
+                raise ValueError(f"unknown frame kind {kind}")
+            self.amount_of_output_in_bytes += len(block)
+            blocks.append(block)
+        return blocks
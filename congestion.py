@@ -0,0 +1,186 @@
+""" Congestion controllers gating the sender's sliding window, with the window measured in segments """
+
+import csv
+import time
+from abc import ABC, abstractmethod
+
+INITIAL_WINDOW = 10
+MIN_SSTHRESH = 2
+
+class CongestionController(ABC):
+    """ Shared slow start, fast recovery and timeout handling; subclasses define congestion avoidance """
+
+    name = None
+
+    def __init__(self, max_window, initial_window=INITIAL_WINDOW, record_history=False):
+        self.max_window = max_window
+        self.cwnd = float(min(initial_window, max_window))
+        self.ssthresh = float(max_window)
+        self.in_recovery = False
+        self.start_time = time.monotonic()
+        self.record_history = record_history
+        self.history = []
+        self.record("init")
+
+    def update_rtt(self, srtt):
+        pass
+
+    def record(self, event):
+        """ Appends a history entry when a cwnd log was requested and cwnd or ssthresh changed """
+        if not self.record_history:
+            return
+        if self.history and self.history[-1][2:] == (self.cwnd, self.ssthresh):
+            return
+        self.history.append((time.monotonic() - self.start_time, event, self.cwnd, self.ssthresh))
+
+    def window(self):
+        return max(1, int(self.cwnd))
+
+    def clamp(self):
+        self.cwnd = max(1.0, min(self.cwnd, float(self.max_window)))
+
+    def on_ack(self, acked_segments):
+        """ New data acknowledged outside fast recovery """
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked_segments
+        else:
+            self.congestion_avoidance(acked_segments)
+        self.clamp()
+        self.record("ack")
+
+    @abstractmethod
+    def congestion_avoidance(self, acked_segments):
+        """ Grows cwnd for acked_segments newly acknowledged segments once cwnd has reached ssthresh """
+
+    def reduced_window(self, flight_size):
+        """ Window to fall back to after a loss, given the number of segments in flight """
+        return max(flight_size / 2, MIN_SSTHRESH)
+
+    def enter_recovery(self, flight_size):
+        """ Fast retransmit: third duplicate ACK """
+        self.ssthresh = self.reduced_window(flight_size)
+        self.cwnd = self.ssthresh + 3
+        self.in_recovery = True
+        self.clamp()
+        self.record("fast_retransmit")
+
+    def on_recovery_dupack(self):
+        self.cwnd += 1
+        self.clamp()
+        self.record("recovery_dupack")
+
+    def on_partial_ack(self, acked_segments):
+        """ NewReno partial ACK: deflate by the amount acked and stay in recovery """
+        self.cwnd = max(self.ssthresh, self.cwnd - acked_segments + 1)
+        self.clamp()
+        self.record("partial_ack")
+
+    def exit_recovery(self):
+        self.cwnd = self.ssthresh
+        self.in_recovery = False
+        self.clamp()
+        self.record("recovery_exit")
+
+    def on_timeout(self, flight_size):
+        self.ssthresh = self.reduced_window(flight_size)
+        self.cwnd = 1.0
+        self.in_recovery = False
+        self.record("timeout")
+
+    def export(self, filename):
+        """ Writes the cwnd time series as CSV """
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["time_ms", "event", "cwnd", "ssthresh"])
+            for elapsed, event, cwnd, ssthresh in self.history:
+                writer.writerow([round(elapsed * 1000, 3), event, round(cwnd, 3), round(ssthresh, 3)])
+
+class FixedWindow(CongestionController):
+    """ No congestion control: the window is always max_window, as before congestion control existed """
+
+    name = "none"
+
+    def __init__(self, max_window, initial_window=INITIAL_WINDOW, record_history=False):
+        super().__init__(max_window, max_window, record_history)
+
+    def on_ack(self, acked_segments):
+        pass
+
+    def congestion_avoidance(self, acked_segments):
+        pass
+
+    def enter_recovery(self, flight_size):
+        self.in_recovery = True
+
+    def on_recovery_dupack(self):
+        pass
+
+    def on_partial_ack(self, acked_segments):
+        pass
+
+    def exit_recovery(self):
+        self.in_recovery = False
+
+    def on_timeout(self, flight_size):
+        pass
+
+class NewReno(CongestionController):
+    """ RFC 6582 NewReno: additive increase of one segment per window """
+
+    name = "reno"
+
+    def congestion_avoidance(self, acked_segments):
+        self.cwnd += acked_segments / self.cwnd
+
+class Cubic(CongestionController):
+    """ RFC 8312 CUBIC window growth with the TCP-friendly region """
+
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, max_window, initial_window=INITIAL_WINDOW, record_history=False):
+        super().__init__(max_window, initial_window, record_history)
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+        self.w_est = 0.0
+        self.srtt = None
+
+    def update_rtt(self, srtt):
+        self.srtt = srtt
+
+    def reduced_window(self, flight_size):
+        self.w_max = self.cwnd
+        self.epoch_start = None
+        return max(self.cwnd * self.BETA, MIN_SSTHRESH)
+
+    def congestion_avoidance(self, acked_segments):
+        now = time.monotonic()
+        if self.epoch_start is None:
+            self.epoch_start = now
+            self.w_est = self.cwnd
+            if self.w_max <= self.cwnd:
+                self.w_max = self.cwnd
+                self.k = 0.0
+            else:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+        rtt = self.srtt if self.srtt is not None else 0.0
+        elapsed = now - self.epoch_start + rtt
+        target = self.C * (elapsed - self.k) ** 3 + self.w_max
+
+        self.w_est += 3 * (1 - self.BETA) / (1 + self.BETA) * acked_segments / self.cwnd
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd * acked_segments
+        else:
+            self.cwnd += 0.01 * acked_segments / self.cwnd
+        self.cwnd = max(self.cwnd, self.w_est)
+
+    def on_timeout(self, flight_size):
+        super().on_timeout(flight_size)
+        self.w_est = 0.0
+
+CONGESTION_CONTROLLERS = {controller.name: controller for controller in (NewReno, Cubic, FixedWindow)}
+
+def create_congestion_controller(name, max_window, record_history=False):
+    return CONGESTION_CONTROLLERS[name](max_window, record_history=record_history)
@@ -0,0 +1,152 @@
+""" XOR parity forward error correction for DATA segments.
+
+The sender follows every block of k consecutive DATA segments with one PARITY segment holding
+the XOR of the block's segments, zero-padded to the segment size. A receiver that has all but
+one segment of a block rebuilds the missing one from the parity, without waiting a round trip
+for its retransmission. XOR repairs a single loss per block; k is chosen from the measured loss
+rate so that blocks rarely lose more.
+"""
+
+from collections import OrderedDict
+
+from protocol import decode_parity, encode_parity
+
+def xor_of(segments, segment_size):
+    """ XOR of byte strings zero-padded to segment_size; little-endian integers make the padding implicit """
+    parity = 0
+    for data in segments:
+        parity ^= int.from_bytes(data, 'little')
+    return parity.to_bytes(segment_size, 'little')
+
+def probability_of_multiple_losses(segments, loss_rate):
+    """ Chance that two or more of `segments` independent segments are lost """
+    delivered = 1 - loss_rate
+    return 1 - delivered ** segments - segments * loss_rate * delivered ** (segments - 1)
+
+class ParityEncoder:
+    """ Accumulates the XOR of the DATA segments of the block being sent """
+
+    def __init__(self):
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        self.first_seq_number = None
+        self.count = 0
+        self.segment_size = 0
+        self.block_length = 0
+        self.parity = 0
+
+    def add(self, seq_number, data):
+        if self.count == 0:
+            self.first_seq_number = seq_number
+            self.segment_size = len(data)
+        self.parity ^= int.from_bytes(data, 'little')
+        self.count += 1
+        self.block_length += len(data)
+
+    def finish(self):
+        """ Returns (seq_number, payload) of the block's PARITY segment and starts a new block, or None if it is empty """
+        if self.count == 0:
+            return None
+        parity = encode_parity(self.count, self.segment_size, self.block_length,
+                               self.parity.to_bytes(self.segment_size, 'little'))
+        first_seq_number = self.first_seq_number
+        self.reset()
+        return first_seq_number, parity
+
+class BlockSizeController:
+    """ Adapts k to an EWMA of the segment loss rate.
+
+    k is the largest block size whose k + 1 segments (data plus parity) lose two or more with at
+    most target_probability, since beyond that the parity cannot repair the block.
+    """
+
+    def __init__(self, min_block_size=2, max_block_size=64, target_probability=0.01, gain=1 / 128):
+        self.min_block_size = min_block_size
+        self.max_block_size = max_block_size
+        self.target_probability = target_probability
+        self.gain = gain
+        self.loss_rate = 0.0
+
+    def observe(self, lost):
+        self.loss_rate += self.gain * ((1.0 if lost else 0.0) - self.loss_rate)
+
+    def block_size(self):
+        for block_size in range(self.max_block_size, self.min_block_size, -1):
+            if probability_of_multiple_losses(block_size + 1, self.loss_rate) <= self.target_probability:
+                return block_size
+        return self.min_block_size
+
+class ParityDecoder:
+    """ Parity segments whose block is still missing data, and the recent segments needed to use them.
+
+    By the time a parity arrives, the segments of its block before the first hole have already
+    been written out, so in-order segments are remembered for `horizon` bytes behind the
+    receiver's expected sequence number. Segments ahead of it are looked up in the reorder buffer.
+    """
+
+    def __init__(self, modulus, horizon):
+        self.modulus = modulus
+        self.horizon = horizon
+        self.blocks = {}
+        self.delivered = OrderedDict()
+        self.delivered_bytes = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def remember(self, seq_number, data):
+        self.delivered[seq_number] = data
+        self.delivered_bytes += len(data)
+        while self.delivered_bytes > self.horizon:
+            _, data = self.delivered.popitem(last=False)
+            self.delivered_bytes -= len(data)
+
+    def add(self, seq_number, payload):
+        """ Stores a PARITY segment; returns False for a malformed one """
+        block = decode_parity(payload)
+        if block is None:
+            return False
+        self.blocks[seq_number] = block
+        return True
+
+    def block_segments(self, first_seq_number, count, segment_size, block_length):
+        """ (seq_number, length) of each segment of a block; only the last one can be short """
+        for index in range(count):
+            length = segment_size if index < count - 1 else block_length - index * segment_size
+            yield (first_seq_number + index * segment_size) % self.modulus, length
+
+    def recover(self, expected_seq_number, buffered):
+        """ Returns (seq_number, data) for each block now missing exactly one segment, nearest first.
+
+        buffered(seq_number) returns an out-of-order segment held by the receiver, or None.
+        Blocks with nothing missing, or whose delivered segments are no longer remembered, are
+        discarded; blocks missing two or more segments wait for retransmissions.
+        """
+        half = self.modulus // 2
+        recovered = []
+        for first_seq_number in sorted(self.blocks, key=lambda seq_number: (seq_number - expected_seq_number + half) % self.modulus):
+            count, segment_size, block_length, parity = self.blocks[first_seq_number]
+            segments = []
+            missing = []
+            for seq_number, length in self.block_segments(first_seq_number, count, segment_size, block_length):
+                data = self.delivered.get(seq_number)
+                if data is None and (seq_number - expected_seq_number) % self.modulus < half:
+                    data = buffered(seq_number)
+                    if data is None:
+                        missing.append((seq_number, length))
+                        continue
+                if data is None or len(data) != length:
+                    missing = None
+                    break
+                segments.append(data)
+            if missing is not None and len(missing) > 1:
+                continue
+            del self.blocks[first_seq_number]
+            if missing:
+                seq_number, length = missing[0]
+                recovered.append((seq_number, xor_of(segments + [parity], segment_size)[:length]))
+        return recovered
@@ -0,0 +1,280 @@
+""" Seedable network impairment: loss models, delay, jitter, reordering, duplication and a bandwidth limit.
+
+An Impairment decides the fate of each datagram in one direction. An ImpairedChannel applies
+those decisions: it hands a datagram to a deliver callback immediately, holds it until its
+release time, or reports it to a drop callback. The sender runs its own traffic through two
+channels; `python impairment.py` runs them in a relay process between unmodified endpoints.
+"""
+
+import argparse
+import heapq
+import itertools
+import random
+import selectors
+import signal
+import socket
+import sys
+import time
+
+from batch_io import enlarge_socket_buffers
+
+class BernoulliLoss:
+    """ Independent loss with a fixed probability """
+
+    def __init__(self, probability, rng):
+        self.probability = probability
+        self.rng = rng
+
+    def drops(self):
+        return self.probability > 0 and self.rng.random() < self.probability
+
+class GilbertElliottLoss:
+    """ Two-state burst loss: a good state that loses with loss_good and a bad state that loses with loss_bad """
+
+    def __init__(self, good_to_bad, bad_to_good, rng, loss_good=0.0, loss_bad=1.0):
+        self.good_to_bad = good_to_bad
+        self.bad_to_good = bad_to_good
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.rng = rng
+        self.bad = False
+
+    @classmethod
+    def with_mean_loss(cls, loss_rate, mean_burst_length, rng):
+        """ Chain whose long-run loss rate is loss_rate, lost in bursts of mean_burst_length datagrams """
+        bad_to_good = 1 / mean_burst_length
+        good_to_bad = loss_rate * bad_to_good / (1 - loss_rate) if loss_rate < 1 else 1.0
+        return cls(min(1.0, good_to_bad), bad_to_good, rng)
+
+    def drops(self):
+        if self.bad:
+            self.bad = self.rng.random() >= self.bad_to_good
+        else:
+            self.bad = self.rng.random() < self.good_to_bad
+        loss = self.loss_bad if self.bad else self.loss_good
+        return loss > 0 and self.rng.random() < loss
+
+class Impairment:
+    """ Fate of the datagrams in one direction; times are in seconds and bandwidth in bits per second """
+
+    def __init__(self, loss=None, delay=0.0, jitter=0.0, reorder=0.0, reorder_gap=0.002, duplicate=0.0,
+                 bandwidth=None, rng=None):
+        self.rng = rng if rng is not None else random.Random()
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_gap = reorder_gap
+        self.duplicate = duplicate
+        self.bandwidth = bandwidth
+        self.link_free_at = 0.0
+
+    @property
+    def holds_datagrams(self):
+        """ Whether any datagram can be delivered later than it was submitted """
+        return bool(self.delay or self.jitter or self.reorder or self.bandwidth)
+
+    def delivery_times(self, now, size):
+        """ Release times for one datagram: empty when it is lost, two entries when it is duplicated """
+        if self.loss is not None and self.loss.drops():
+            return []
+        departure = now
+        if self.bandwidth:
+            departure = max(now, self.link_free_at) + size * 8 / self.bandwidth
+            self.link_free_at = departure
+        arrival = departure + self.delay
+        if self.jitter:
+            arrival += self.rng.uniform(0, self.jitter)
+        if self.reorder and self.rng.random() < self.reorder:
+            arrival += self.reorder_gap
+        if self.duplicate and self.rng.random() < self.duplicate:
+            return [arrival, arrival]
+        return [arrival]
+
+class ImpairedChannel:
+    """ Applies an Impairment to datagrams, releasing held ones from the owner's event loop """
+
+    def __init__(self, impairment, deliver, on_drop=None):
+        self.impairment = impairment
+        self.deliver = deliver
+        self.on_drop = on_drop
+        self.held = []
+        self.order = itertools.count()
+        self.number_of_datagrams_dropped = 0
+        self.number_of_datagrams_duplicated = 0
+
+    def __len__(self):
+        return len(self.held)
+
+    @property
+    def holds_datagrams(self):
+        return self.impairment.holds_datagrams
+
+    def submit(self, datagram, size):
+        now = time.monotonic()
+        delivery_times = self.impairment.delivery_times(now, size)
+        if not delivery_times:
+            self.number_of_datagrams_dropped += 1
+            if self.on_drop is not None:
+                self.on_drop(datagram)
+            return
+        self.number_of_datagrams_duplicated += len(delivery_times) - 1
+        for delivery_time in delivery_times:
+            if delivery_time <= now and not self.held:
+                self.deliver(datagram)
+            else:
+                heapq.heappush(self.held, (delivery_time, next(self.order), datagram))
+
+    def next_deadline(self):
+        return self.held[0][0] if self.held else None
+
+    def release(self, now=None):
+        """ Delivers every held datagram whose release time has passed, in release order """
+        now = time.monotonic() if now is None else now
+        while self.held and self.held[0][0] <= now:
+            _, _, datagram = heapq.heappop(self.held)
+            self.deliver(datagram)
+
+    def clear(self):
+        self.held = []
+
+def add_impairment_arguments(parser):
+    """ Options shared by the sender and the relay; loss rates themselves are the flp/rlp arguments """
+    group = parser.add_argument_group("network impairment")
+    group.add_argument("--seed", type=int, help="seed the impairment random generators for a reproducible run")
+    group.add_argument("--burst-length", type=float, default=1.0,
+                       help="mean loss burst length; above 1 switches from Bernoulli to Gilbert-Elliott loss")
+    group.add_argument("--delay", type=float, default=0.0, help="one-way delay in ms added to every datagram")
+    group.add_argument("--jitter", type=float, default=0.0, help="uniform random extra delay of up to this many ms")
+    group.add_argument("--reorder", type=float, default=0.0, help="probability that a datagram is held back and overtaken")
+    group.add_argument("--reorder-gap", type=float, default=2.0, help="extra delay in ms of a reordered datagram")
+    group.add_argument("--duplicate", type=float, default=0.0, help="probability that a datagram is delivered twice")
+    group.add_argument("--bandwidth", type=float, help="link rate in Mbit/s, applied in each direction")
+
+def create_impairment(args, loss_rate, direction):
+    """ Builds one direction's Impairment; with a seed, each direction gets its own reproducible stream """
+    rng = random.Random(f"{args.seed}-{direction}") if args.seed is not None else random.Random()
+    loss = None
+    if loss_rate > 0:
+        if args.burst_length > 1:
+            loss = GilbertElliottLoss.with_mean_loss(loss_rate, args.burst_length, rng)
+        else:
+            loss = BernoulliLoss(loss_rate, rng)
+    bandwidth = args.bandwidth * 1e6 if args.bandwidth else None
+    return Impairment(loss, args.delay / 1000, args.jitter / 1000, args.reorder, args.reorder_gap / 1000,
+                      args.duplicate, bandwidth, rng)
+
+class Relay:
+    """ Forwards datagrams between senders and a receiver through one impaired channel per direction.
+
+    Senders send to listen_port. Each sender gets its own upstream socket, so the receiver sees
+    one address per sender and its replies can be routed back. With upstream_port, every sender
+    shares one upstream socket bound to that port, which is what a single-transfer receiver
+    expects as its sender_port, and replies go to the sender heard from most recently.
+    """
+
+    def __init__(self, listen_port, target_port, forward, reverse, upstream_port=None, host='localhost'):
+        self.host = host
+        self.target_address = (host, target_port)
+        self.upstream_port = upstream_port
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listen_socket.bind((host, listen_port))
+        self.listen_socket.setblocking(False)
+        enlarge_socket_buffers(self.listen_socket)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listen_socket, selectors.EVENT_READ, None)
+        self.upstream_sockets = {}
+        self.shared_upstream_socket = None
+        self.latest_sender_address = None
+        self.forward = ImpairedChannel(forward, self.send_forward)
+        self.reverse = ImpairedChannel(reverse, self.send_reverse)
+        self.running = True
+
+    def open_upstream_socket(self, port, sender_address):
+        upstream_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        upstream_socket.bind((self.host, port))
+        upstream_socket.setblocking(False)
+        enlarge_socket_buffers(upstream_socket)
+        self.selector.register(upstream_socket, selectors.EVENT_READ, sender_address)
+        return upstream_socket
+
+    def upstream_socket_for(self, sender_address):
+        if self.upstream_port is not None:
+            self.latest_sender_address = sender_address
+            if self.shared_upstream_socket is None:
+                self.shared_upstream_socket = self.open_upstream_socket(self.upstream_port, None)
+            return self.shared_upstream_socket
+        upstream_socket = self.upstream_sockets.get(sender_address)
+        if upstream_socket is None:
+            upstream_socket = self.open_upstream_socket(0, sender_address)
+            self.upstream_sockets[sender_address] = upstream_socket
+        return upstream_socket
+
+    def send_forward(self, datagram):
+        packet, sender_address = datagram
+        self.upstream_socket_for(sender_address).sendto(packet, self.target_address)
+
+    def send_reverse(self, datagram):
+        packet, sender_address = datagram
+        self.listen_socket.sendto(packet, sender_address)
+
+    def drain(self, sock, sender_address):
+        while True:
+            try:
+                packet, address = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            if sock is self.listen_socket:
+                self.forward.submit((packet, address), len(packet))
+            else:
+                self.reverse.submit((packet, sender_address or self.latest_sender_address), len(packet))
+
+    def serve_forever(self):
+        try:
+            while self.running:
+                deadlines = [deadline for deadline in (self.forward.next_deadline(), self.reverse.next_deadline())
+                             if deadline is not None]
+                timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+                for key, _ in self.selector.select(timeout):
+                    self.drain(key.fileobj, key.data)
+                now = time.monotonic()
+                self.forward.release(now)
+                self.reverse.release(now)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.selector.close()
+        self.listen_socket.close()
+        for upstream_socket in self.upstream_sockets.values():
+            upstream_socket.close()
+        if self.shared_upstream_socket is not None:
+            self.shared_upstream_socket.close()
+        print(f"Forward datagrams dropped: {self.forward.number_of_datagrams_dropped}")
+        print(f"Reverse datagrams dropped: {self.reverse.number_of_datagrams_dropped}")
+        print(f"Datagrams duplicated: {self.forward.number_of_datagrams_duplicated + self.reverse.number_of_datagrams_duplicated}")
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="impairment.py", usage="python impairment.py listen_port target_port flp rlp [options]",
+                                     description="Relay between a sender and a receiver that impairs the traffic in both directions.")
+    parser.add_argument("listen_port", type=int, help="port the sender sends to")
+    parser.add_argument("target_port", type=int, help="port the receiver listens on")
+    parser.add_argument("flp", type=float, help="loss rate from sender to receiver")
+    parser.add_argument("rlp", type=float, help="loss rate from receiver to sender")
+    parser.add_argument("--upstream-port", type=int,
+                        help="bind the upstream socket to this port (the sender_port given to a single-transfer receiver)")
+    add_impairment_arguments(parser)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    relay = Relay(args.listen_port, args.target_port, create_impairment(args, args.flp, "forward"),
+                  create_impairment(args, args.rlp, "reverse"), args.upstream_port)
+    relay.serve_forever()
+
+if __name__ == "__main__":
+    main()
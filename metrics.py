@@ -0,0 +1,227 @@
+""" Live protocol metrics in Prometheus text format, served over HTTP or a Unix socket, plus sampled tracing.
+
+Counters and gauges are read from the endpoints' existing attributes when a scrape arrives, so
+they cost nothing on the hot paths. Only histograms are updated as events happen. Tracing hooks
+are guarded by a `tracer is not None` check, which is all they cost when tracing is off.
+"""
+
+import bisect
+import http.server
+import json
+import math
+import os
+import socketserver
+import threading
+import time
+
+ACK_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SPAN_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in sorted(labels.items())) + "}"
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """ Cumulative-bucket histogram; observe() is one bisect and two additions """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", {**labels, "le": format_value(bound)}, cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+class Rate:
+    """ Per-second rate of a monotonically increasing value since the previous scrape (or creation) """
+
+    def __init__(self, read):
+        self.read = read
+        self.previous = (time.monotonic(), read())
+
+    def __call__(self):
+        now = time.monotonic()
+        value = self.read()
+        previous = self.previous
+        self.previous = (now, value)
+        if now <= previous[0]:
+            return 0.0
+        return (value - previous[1]) / (now - previous[0])
+
+class MetricsRegistry:
+    """ Named metrics whose values are collected on demand.
+
+    A collector returns either a single value or an iterable of (labels, value) pairs, which is
+    how per-connection metrics of the receiver server are exposed.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def counter(self, name, help, collect):
+        self.metrics.append((name, "counter", help, collect))
+
+    def gauge(self, name, help, collect):
+        self.metrics.append((name, "gauge", help, collect))
+
+    def histogram(self, name, help, collect):
+        """ collect returns a Histogram, or an iterable of (labels, Histogram) pairs """
+        self.metrics.append((name, "histogram", help, collect))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, type, help, collect in self.metrics:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                collected = collect()
+                if collected is None:
+                    continue
+                if isinstance(collected, (int, float, Histogram)):
+                    collected = [({}, collected)]
+                for labels, value in collected:
+                    if type == "histogram":
+                        for sample_name, sample_labels, sample_value in value.samples(name, labels):
+                            lines.append(f"{sample_name}{format_labels(sample_labels)} {format_value(sample_value)}")
+                    else:
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixMetricsHandler(socketserver.BaseRequestHandler):
+    """ Writes one exposition to each client that connects, then closes the connection """
+
+    def handle(self):
+        self.request.sendall(self.server.registry.render().encode())
+
+class MetricsServer:
+    """ Serves a registry from a daemon thread: HTTP on localhost:port, or a Unix stream socket at path """
+
+    def __init__(self, registry, port=None, path=None):
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            self.server = socketserver.ThreadingUnixStreamServer(path, UnixMetricsHandler)
+        else:
+            self.server = http.server.ThreadingHTTPServer(('localhost', port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.path = path
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+class Tracer:
+    """ Times one in sample_every calls of each traced hot path.
+
+    Sampled spans feed a per-span duration histogram and, with a filename, are appended to it
+    as JSON lines once buffer_size records are waiting or flush_interval seconds have passed,
+    and when the tracer is closed, so a long transfer keeps a bounded number in memory.
+    """
+
+    def __init__(self, filename=None, sample_every=100, buffer_size=1024, flush_interval=1.0):
+        self.filename = filename
+        self.sample_every = max(1, sample_every)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.calls = {}
+        self.histograms = {}
+        self.records = []
+        self.flushed_at = time.monotonic()
+
+    def start(self, span):
+        """ Returns a start timestamp when this call is sampled, otherwise None """
+        calls = self.calls.get(span, 0) + 1
+        self.calls[span] = calls
+        if calls % self.sample_every:
+            return None
+        return time.perf_counter()
+
+    def finish(self, span, started, **fields):
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        histogram = self.histograms.get(span)
+        if histogram is None:
+            histogram = self.histograms[span] = Histogram(SPAN_BUCKETS)
+        histogram.observe(duration)
+        if self.filename is not None:
+            self.records.append({"span": span, "time": time.time(), "duration": duration, **fields})
+            if len(self.records) >= self.buffer_size or time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def register_metrics(self, registry, prefix):
+        registry.histogram(f"{prefix}_trace_span_seconds", f"Duration of sampled hot-path spans (1 in {self.sample_every})",
+                           lambda: [({"span": span}, histogram) for span, histogram in sorted(self.histograms.items())])
+
+    def flush(self):
+        """ Appends the buffered records to the trace file """
+        self.flushed_at = time.monotonic()
+        if self.filename is None or not self.records:
+            return
+        with open(self.filename, 'a') as file:
+            file.write("".join(json.dumps(record) + "\n" for record in self.records))
+        self.records = []
+
+    def close(self):
+        self.flush()
+
+def add_metrics_arguments(parser):
+    group = parser.add_argument_group("metrics and tracing")
+    group.add_argument("--metrics-port", type=int, help="serve Prometheus metrics over HTTP on localhost:PORT/metrics")
+    group.add_argument("--metrics-socket", help="serve Prometheus metrics on this Unix socket path instead")
+    group.add_argument("--trace", help="append sampled hot-path spans to this JSON-lines file")
+    group.add_argument("--trace-sample", type=int, default=100, help="trace one in N calls of each hot path")
+
+def create_tracer(args):
+    if args.trace is None:
+        return None
+    return Tracer(args.trace, args.trace_sample)
+
+def serve_metrics(args, endpoint, index=0):
+    """ Serves endpoint.register_metrics() where the command line asks; index offsets the port or path for workers """
+    if args.metrics_port is None and args.metrics_socket is None:
+        return None
+    registry = MetricsRegistry()
+    endpoint.register_metrics(registry)
+    if args.metrics_socket is not None:
+        path = args.metrics_socket if index == 0 else f"{args.metrics_socket}.{index}"
+        return MetricsServer(registry, path=path)
+    return MetricsServer(registry, port=args.metrics_port + index)
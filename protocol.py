@@ -0,0 +1,148 @@
+""" Wire formats shared by sender.py and receiver.py """
+
+import struct
+
+DATA = 0
+ACK = 1
+SYN = 2
+FIN = 3
+SACK = 4
+PARITY = 5
+
+PACKET_TYPE_NAMES = {DATA: "DATA", ACK: "ACK", SYN: "SYN", FIN: "FIN", SACK: "SACK", PARITY: "PARITY"}
+
+OPTION_SACK_PERMITTED = 1
+OPTION_MSS = 2
+OPTION_WINDOW_SCALE = 3
+OPTION_STRIPE = 4
+OPTION_RESUME = 5
+OPTION_FEC = 6
+OPTION_COMPRESSION = 7
+
+MAX_SACK_BLOCKS = 16
+MAX_WINDOW_SCALE = 14
+
+DEFAULT_MSS = 1000
+MAX_UDP_PAYLOAD = 65507
+RECV_BUFFER_SIZE = 65535
+
+class V1Header:
+    """ The original 4-byte header: 2-byte type, 2-byte sequence number, no window field """
+
+    version = 1
+    size = 4
+    seq_bytes = 2
+    seq_modulus = 1 << 16
+
+    def pack(self, type, seq_number, window=0):
+        return type.to_bytes(2, 'big') + seq_number.to_bytes(2, 'big')
+
+    def unpack(self, packet):
+        """ Returns (type, seq_number, window); v1 packets carry no window """
+        return int.from_bytes(packet[0:2], 'big'), int.from_bytes(packet[2:4], 'big'), None
+
+class V2Header:
+    """ Versioned 8-byte header: marker, type, 16-bit scaled window, 32-bit sequence number.
+
+    The marker byte has its high bit set, which a v1 header (whose first byte is the high
+    byte of a small type value) never has, so both formats can share one port.
+    """
+
+    version = 2
+    marker = 0x80 | 2
+    size = 8
+    seq_bytes = 4
+    seq_modulus = 1 << 32
+    layout = struct.Struct('!BBHI')
+
+    def pack(self, type, seq_number, window=0):
+        return self.layout.pack(self.marker, type, min(window, 0xFFFF), seq_number)
+
+    def unpack(self, packet):
+        _, type, window, seq_number = self.layout.unpack_from(packet)
+        return type, seq_number, window
+
+V1 = V1Header()
+V2 = V2Header()
+
+MAX_MSS = MAX_UDP_PAYLOAD - V2.size
+
+def header_format_of(packet):
+    """ Detects which header version a datagram uses """
+    return V2 if packet and packet[0] == V2.marker else V1
+
+def window_scale_for(window_bytes):
+    """ Smallest shift that lets window_bytes fit the 16-bit window field """
+    shift = 0
+    while (window_bytes >> shift) > 0xFFFF and shift < MAX_WINDOW_SCALE:
+        shift += 1
+    return shift
+
+def encode_options(options):
+    """ Encodes a {option_id: bytes} mapping as type/length/value triples carried in a SYN payload """
+    encoded = b''
+    for option_id, value in options.items():
+        encoded += option_id.to_bytes(1, 'big') + len(value).to_bytes(1, 'big') + value
+    return encoded
+
+def decode_options(payload):
+    """ Decodes SYN options, ignoring a truncated trailing option """
+    options = {}
+    position = 0
+    while position + 2 <= len(payload):
+        option_id = payload[position]
+        length = payload[position + 1]
+        value = bytes(payload[position + 2:position + 2 + length])
+        if len(value) < length:
+            break
+        options[option_id] = value
+        position += 2 + length
+    return options
+
+STRIPE_LAYOUT = struct.Struct('!QQQ')
+
+def encode_stripe(transfer_id, offset, total_size):
+    """ OPTION_STRIPE value: which transfer a striped connection belongs to and where its bytes go """
+    return STRIPE_LAYOUT.pack(transfer_id, offset, total_size)
+
+def decode_stripe(value):
+    """ Returns (transfer_id, offset, total_size), or None for a malformed option """
+    if len(value) != STRIPE_LAYOUT.size:
+        return None
+    return STRIPE_LAYOUT.unpack(value)
+
+RESUME_LAYOUT = struct.Struct('!QI')
+
+def encode_resume(position, checksum):
+    """ OPTION_RESUME value: (file size, file token) in a SYN, (committed offset, its crc32) in the SYN ACK """
+    return RESUME_LAYOUT.pack(position, checksum)
+
+def decode_resume(value):
+    if len(value) != RESUME_LAYOUT.size:
+        return None
+    return RESUME_LAYOUT.unpack(value)
+
+PARITY_LAYOUT = struct.Struct('!HII')
+
+def encode_parity(count, segment_size, block_length, parity):
+    """ PARITY payload: the block's segment count, segment size and length in bytes, then the XOR of its segments """
+    return PARITY_LAYOUT.pack(count, segment_size, block_length) + parity
+
+def decode_parity(payload):
+    """ Returns (count, segment_size, block_length, parity), or None for a malformed payload """
+    if len(payload) < PARITY_LAYOUT.size:
+        return None
+    count, segment_size, block_length = PARITY_LAYOUT.unpack_from(payload)
+    parity = bytes(payload[PARITY_LAYOUT.size:])
+    if count == 0 or len(parity) != segment_size or not (count - 1) * segment_size < block_length <= count * segment_size:
+        return None
+    return count, segment_size, block_length, parity
+
+def encode_sack_blocks(blocks, seq_bytes=2):
+    """ Packs (start, end) byte ranges of out-of-order data held by the receiver """
+    return b''.join(start.to_bytes(seq_bytes, 'big') + end.to_bytes(seq_bytes, 'big') for start, end in blocks[:MAX_SACK_BLOCKS])
+
+def decode_sack_blocks(payload, seq_bytes=2):
+    step = 2 * seq_bytes
+    return [(int.from_bytes(payload[i:i + seq_bytes], 'big'), int.from_bytes(payload[i + seq_bytes:i + step], 'big'))
+            for i in range(0, len(payload) - step + 1, step)]
@@ -1,165 +1,1118 @@
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import selectors
+import signal
 import socket
 import sys
 import threading
 import time
-from collections import OrderedDict
+import zlib
+from collections import deque
 
-DATA = 0
-ACK = 1
-SYN = 2
-FIN = 3
-HEADER_SIZE = 4
-MAX_PAYLOAD_SIZE = 1000
+from batch_io import BatchReceiver, enlarge_socket_buffers
+from block_compression import ALGORITHM_NAMES, FrameDecoder, choose_algorithm
+from fec import ParityDecoder
+from metrics import ACK_LATENCY_BUCKETS, Histogram, Rate, add_metrics_arguments, create_tracer, serve_metrics
+from protocol import (ACK, DATA, DEFAULT_MSS, FIN, MAX_MSS, OPTION_COMPRESSION, OPTION_FEC, OPTION_MSS, OPTION_RESUME,
+                      OPTION_SACK_PERMITTED, OPTION_STRIPE, OPTION_WINDOW_SCALE, PARITY, SACK, SYN, V1, V2, decode_options, decode_resume,
+                      decode_stripe, encode_options, encode_resume, encode_sack_blocks, header_format_of,
+                      window_scale_for)
+from segment_logger import FULL, LOG_MODES, SegmentLogger
 
-class Receiver:
-    def __init__(self, receiver_port, sender_port, filename, max_window_size):
-        self.receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.receiver_socket.bind(('localhost', receiver_port))
-        self.sender_address = ('localhost', sender_port)
+class ReorderBuffer:
+    """ Out-of-order segments kept in a bisect-maintained array of unwrapped stream positions.
+
+    Sequence numbers are mapped onto a monotonically increasing position relative to the
+    expected sequence number, so ordering stays correct across wraparound. Insertion is a
+    binary search, and contiguous segments are drained from the front by advancing a head
+    index that is compacted lazily.
+    """
+
+    def __init__(self, modulus=65536, acceptance_window=32768):
+        self.modulus = modulus
+        self.acceptance_window = min(acceptance_window, modulus // 2)
+        self.reset(0)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def reset(self, expected_seq_number):
+        self.base_seq_number = expected_seq_number
+        self.base_position = 0
+        self.positions = []
+        self.head = 0
+        self.segments = {}
+
+    def offset(self, seq_number):
+        return (seq_number - self.base_seq_number) % self.modulus
+
+    def insert(self, seq_number, data):
+        """ Buffers a segment ahead of the expected sequence number; returns False for stale or duplicate data """
+        offset = self.offset(seq_number)
+        if offset == 0 or offset >= self.acceptance_window:
+            return False
+        position = self.base_position + offset
+        if position in self.segments:
+            return False
+        self.segments[position] = data
+        bisect.insort(self.positions, position, lo=self.head)
+        return True
+
+    def get(self, seq_number):
+        """ The buffered segment starting at seq_number, or None """
+        offset = self.offset(seq_number)
+        if offset == 0 or offset >= self.acceptance_window:
+            return None
+        return self.segments.get(self.base_position + offset)
+
+    def advance(self, expected_seq_number):
+        """ Moves the base to expected_seq_number and returns the now contiguous buffered segments in order """
+        self.base_position += self.offset(expected_seq_number)
+        self.base_seq_number = expected_seq_number
+        contiguous = []
+        while self.head < len(self.positions) and self.positions[self.head] <= self.base_position:
+            position = self.positions[self.head]
+            self.head += 1
+            data = self.segments.pop(position)
+            if position == self.base_position:
+                contiguous.append(data)
+                self.base_position += len(data)
+                self.base_seq_number = (self.base_seq_number + len(data)) % self.modulus
+        if self.head > 64 and self.head * 2 > len(self.positions):
+            del self.positions[:self.head]
+            self.head = 0
+        return contiguous
+
+    def blocks(self):
+        """ Contiguous (start, end) sequence ranges held in the buffer, nearest first """
+        blocks = []
+        for index in range(self.head, len(self.positions)):
+            position = self.positions[index]
+            end = position + len(self.segments[position])
+            if blocks and blocks[-1][1] == position:
+                blocks[-1][1] = end
+            else:
+                blocks.append([position, end])
+        return [((self.base_seq_number + start - self.base_position) % self.modulus,
+                 (self.base_seq_number + end - self.base_position) % self.modulus) for start, end in blocks]
+
+WRITER_FLUSH_THRESHOLD = 256 * 1024
+
+class WriterThread:
+    """ One background thread that writes the batches handed off by every StreamingFileWriter of a receiver.
+
+    Batches are written in the order they were submitted, so each file still sees its own
+    payloads in order. The thread is started on the first submission, and a writer whose
+    write failed has its remaining batches discarded without affecting the others.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.batches = deque()
+        self.thread = None
+        self.closing = False
+
+    def submit(self, file_writer, batch, batch_bytes):
+        """ Queues a batch; the caller holds the condition and has already counted it in the writer's backlog """
+        self.batches.append((file_writer, batch, batch_bytes))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.batches and not self.closing:
+                    self.condition.wait()
+                if not self.batches:
+                    return
+                file_writer, batch, batch_bytes = self.batches[0]
+            error = None
+            if file_writer.error is None:
+                try:
+                    file_writer.write_all(batch)
+                except OSError as write_error:
+                    error = write_error
+            with self.condition:
+                self.batches.popleft()
+                if error is not None:
+                    file_writer.error = error
+                file_writer.queued_batches -= 1
+                file_writer.backlog_bytes -= batch_bytes
+                self.condition.notify_all()
+
+    def wait_for(self, file_writer):
+        """ Blocks until every batch of file_writer has been written or discarded """
+        with self.condition:
+            while file_writer.queued_batches:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+class StreamingFileWriter:
+    """ Long-lived output handle that gathers in-order payloads and flushes them with one writev call.
+
+    With an offset, payloads are written with pwritev starting at that position instead of
+    appended, so several striped connections can fill disjoint ranges of one file. With a
+    WriterThread, full batches are handed to it, so a slow disk shows up as a growing backlog
+    instead of stalling the caller.
+    """
+
+    def __init__(self, filename, flush_threshold=WRITER_FLUSH_THRESHOLD, max_buffers=512, offset=None, writer_thread=None):
+        if offset is None:
+            self.fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        else:
+            self.fd = os.open(filename, os.O_WRONLY | os.O_CREAT, 0o644)
+        self.offset = offset
+        self.flush_threshold = flush_threshold
+        self.max_buffers = max_buffers
+        self.pending = []
+        self.pending_bytes = 0
+        self.writer_thread = writer_thread
+        self.queued_batches = 0
+        self.backlog_bytes = 0
+        self.error = None
+        self.closed = False
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        if self.pending_bytes >= self.flush_threshold or len(self.pending) >= self.max_buffers:
+            if self.writer_thread is not None:
+                self.hand_off()
+            else:
+                self.flush()
+
+    def hand_off(self):
+        """ Queues the gathered payloads for the writer thread; raises the error of an earlier failed write """
+        with self.writer_thread.condition:
+            if self.error is not None:
+                raise self.error
+            self.queued_batches += 1
+            self.backlog_bytes += self.pending_bytes
+            self.writer_thread.submit(self, self.pending, self.pending_bytes)
+        self.pending = []
+        self.pending_bytes = 0
+
+    def write_pending(self, pending):
+        if self.offset is not None:
+            if hasattr(os, "pwritev"):
+                written = os.pwritev(self.fd, pending, self.offset)
+            else:
+                written = os.pwrite(self.fd, b''.join(pending), self.offset)
+            self.offset += written
+            return written
+        if hasattr(os, "writev"):
+            return os.writev(self.fd, pending)
+        return os.write(self.fd, b''.join(pending))
+
+    def write_all(self, pending):
+        while pending:
+            written = self.write_pending(pending)
+            while pending and written >= len(pending[0]):
+                written -= len(pending.pop(0))
+            if written:
+                pending[0] = pending[0][written:]
+
+    def flush(self):
+        """ Writes every gathered payload; with a writer thread, waits until this writer's batches are written """
+        if self.writer_thread is None:
+            self.write_all(self.pending)
+            self.pending_bytes = 0
+            return
+        if self.pending:
+            self.hand_off()
+        self.writer_thread.wait_for(self)
+        if self.error is not None:
+            raise self.error
+
+    def flush_soon(self):
+        """ Hands the gathered payloads to the writer thread without waiting; raises the error of an earlier failed write """
+        if self.writer_thread is None:
+            self.flush()
+        elif self.pending:
+            self.hand_off()
+        elif self.error is not None:
+            raise self.error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.abort()
+
+    def abort(self):
+        """ Closes the file, dropping the gathered payloads; batches already handed off are written or skipped first """
+        if self.closed:
+            return
+        self.pending = []
+        self.pending_bytes = 0
+        if self.writer_thread is not None:
+            self.writer_thread.wait_for(self)
+        os.close(self.fd)
+        self.closed = True
+
+def file_crc32(filename, length):
+    """ crc32 of the first length bytes of a file, read in 1 MiB chunks; None if the file is shorter """
+    crc32 = 0
+    with open(filename, 'rb') as file:
+        remaining = length
+        while remaining:
+            chunk = file.read(min(remaining, 1 << 20))
+            if not chunk:
+                return None
+            crc32 = zlib.crc32(chunk, crc32)
+            remaining -= len(chunk)
+    return crc32
+
+class Checkpoint:
+    """ Durable record of how many bytes of an output file are committed, and the crc32 of those bytes.
+
+    Saved by writing a temporary file, fsyncing it and renaming it over the previous record, so a
+    crash leaves either the old or the new checkpoint, never a torn one.
+    """
+
+    def __init__(self, output_filename):
+        self.output_filename = output_filename
+        self.filename = output_filename + ".ckpt"
+
+    def load(self, token, file_size):
+        """ Returns (offset, crc32) to resume from, or (0, 0) when nothing usable is recorded.
+
+        The committed prefix is re-read and its crc32 compared with the record, so a damaged output
+        file restarts the transfer instead of failing the hash check at the very end.
+        """
+        try:
+            with open(self.filename) as file:
+                record = json.load(file)
+            if record["token"] != token or record["size"] != file_size:
+                return 0, 0
+            offset = record["offset"]
+            if file_crc32(self.output_filename, offset) != record["crc32"]:
+                return 0, 0
+            return offset, record["crc32"]
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def save(self, token, file_size, offset, crc32):
+        temporary_filename = self.filename + ".tmp"
+        with open(temporary_filename, 'w') as file:
+            json.dump({"token": token, "size": file_size, "offset": offset, "crc32": crc32}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_filename, self.filename)
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+class ReceiverConnection:
+    """ State of one transfer: negotiated options, reorder buffer, output file and statistics.
+
+    A connection replies to whatever address it was created for, so many of them can share one
+    socket. Once the FIN has been handled the buffers are released and only enough state is
+    kept to answer a retransmitted FIN. Only server connections accept the stripe option, since
+    the stripes of a transfer come from several addresses.
+    """
+
+    def __init__(self, receiver_socket, sender_address, filename, max_window_size, logger, max_mss=MAX_MSS,
+                 ack_every=2, ack_delay=0.005, ack_latency=None, tracer=None, checkpoint_interval=8 * 1024 * 1024,
+                 accept_stripes=False, writer_thread=None):
+        self.receiver_socket = receiver_socket
+        self.sender_address = sender_address
         self.filename = filename
-        self.log_filename = f"receiver_log.txt"
-        self.max_win = max_window_size/1000
+        self.logger = logger
+        self.ack_every = max(1, ack_every)
+        self.ack_delay = ack_delay
+        self.unacknowledged_in_order_segments = 0
+        self.unacknowledged_in_order_bytes = 0
+        self.delayed_ack_deadline = None
+        self.window_update_deadline = None
+        self.advertised_window = max_window_size
+        self.max_window_size = max_window_size
+        self.max_mss = max_mss
+        self.header = V1
+        self.seq_modulus = V1.seq_modulus
+        self.mss = DEFAULT_MSS
+        self.window_scale = 0
+        self.max_win = max(1, max_window_size // self.mss)
+        self.isn = None
         self.expected_seq_number = 0
-        self.sliding_window = OrderedDict()
+        self.sack_enabled = False
+        self.accept_stripes = accept_stripes
+        self.stripe = None
+        self.syn_ack_options = None
+        self.resume = None
+        self.checkpoint = None
+        self.checkpoint_interval = checkpoint_interval
+        self.resume_offset = 0
+        self.initial_file_size = None
+        self.received_offset = 0
+        self.checkpointed_offset = 0
+        self.crc32 = 0
+        self.hash_verified = None
+        self.parity_decoder = None
+        self.frame_decoder = None
+        self.decompression_error = None
+        self.output_error = None
+        self.fin_ack = None
+        self.reorder_buffer = ReorderBuffer(self.seq_modulus, max_window_size)
+        self.file_writer = None
+        self.writer_thread = writer_thread
         self.connection_teardown_flag = 0
+        self.start_time = time.time()
+        self.last_activity = time.monotonic()
         self.amount_of_original_data_received = 0
         self.number_of_original_data_segments_received = 0
         self.number_of_duplicate_data_segments_received = 0
         self.number_of_duplicate_acknowledgments_sent = 0
-        self.time_wait = threading.Timer(2, self.timewait_thread) 
-        self.list_of_packet_seq_numbers_to_be_deleted_from_sliding_window = []
+        self.number_of_parity_segments_received = 0
+        self.number_of_segments_recovered_by_parity = 0
+        self.number_of_window_probes_received = 0
+        self.number_of_window_updates_sent = 0
+        self.ack_latency = ack_latency
+        self.tracer = tracer
+        self.throughput = Rate(lambda: self.amount_of_original_data_received)
 
     def log_message(self, direction, time, type, ack_number, length): 
-        with open(self.log_filename, 'a') as file:  
-            file.write(f"{direction}    {round(time*1000,2)}    {type}  {ack_number}   {length}\n")
+        self.logger.log(direction, time, type, ack_number, length)
 
     def create_packet(self, type, seq_number): 
         """ Helper function to create a packet based on the type """
-        header = type.to_bytes(2, byteorder='big') + seq_number.to_bytes(2, byteorder='big')
-        return header
+        self.advertised_window = self.free_window()
+        return self.header.pack(type, seq_number, self.advertised_window >> self.window_scale)
 
-    def timewait_thread(self):
-        while True:
-            packet, _ = self.receiver_socket.recvfrom(MAX_PAYLOAD_SIZE + HEADER_SIZE)
-            self.log_message("rcv", (time.time() - self.start_time), "ACK", int.from_bytes(packet[2:4]), len(packet[4:])) 
-            packet_type = int.from_bytes(packet[:2], 'big')
-            seq_number = int.from_bytes(packet[2:4], 'big')
-            if packet_type == FIN: 
-                self.expected_seq_number =  (seq_number + 1) % 65536
-                ack_packet = self.create_packet(ACK, self.expected_seq_number)
-                self.receiver_socket.sendto(ack_packet, self.sender_address)
-                self.log_message("snd", (time.time() - self.start_time), "ACK", int.from_bytes(ack_packet[2:4]), len(ack_packet[4:])) 
+    def free_window(self):
+        """ Receive window in bytes: the configured window less the in-order output the disk has fallen behind on.
 
-    def handle_packets(self):
-        count = 0 
-        while self.connection_teardown_flag == 0:
+        The batch being written is not subtracted, since one is handed off every flush threshold
+        and would otherwise shrink the window on every hand-off; only batches queued behind it
+        are. Out-of-order segments are not subtracted either; they lie inside the window the
+        sender was already given, so a sender that respects it never overflows the reorder buffer.
+        """
+        if self.file_writer is None:
+            return self.max_window_size
+        lagging_bytes = self.file_writer.backlog_bytes - self.file_writer.flush_threshold
+        return max(0, self.max_window_size - max(0, lagging_bytes))
 
-            count = count + 1
-            if(count == 1):
-                self.start_time = time.time()
-            packet, _ = self.receiver_socket.recvfrom(MAX_PAYLOAD_SIZE + HEADER_SIZE)
+    @property
+    def label(self):
+        return f"{self.sender_address[0]}:{self.sender_address[1]}"
 
-            packet_type = int.from_bytes(packet[:2], 'big')
-            seq_number = int.from_bytes(packet[2:4], 'big')
-            data = packet[4:] 
-            if packet_type == SYN:
-                self.log_message("rcv", (time.time() - self.start_time), "SYN", int.from_bytes(packet[2:4]), len(packet[4:])) 
-                self.expected_seq_number = seq_number + 1
-                self.expected_seq_number =  self.expected_seq_number % 65536
+    def create_data_ack(self):
+        """ Cumulative ACK for a DATA segment, extended with SACK blocks when negotiated """
+        if self.sack_enabled:
+            return self.create_packet(SACK, self.expected_seq_number) + encode_sack_blocks(self.reorder_buffer.blocks(), self.header.seq_bytes)
+        return self.create_packet(ACK, self.expected_seq_number)
 
-                ack_packet = self.create_packet(ACK, self.expected_seq_number)
-                self.receiver_socket.sendto(ack_packet, self.sender_address)
-                self.log_message("snd", (time.time() - self.start_time), "ACK", int.from_bytes(ack_packet[2:4]), len(ack_packet[4:])) 
+    def negotiate_options(self, header, syn_payload):
+        """ Adopts the SYN's header version and answers its options; returns the SYN ACK options """
+        self.header = header
+        self.seq_modulus = header.seq_modulus
+        options = decode_options(syn_payload)
+        ack_options = {}
+        self.sack_enabled = OPTION_SACK_PERMITTED in options
+        if self.sack_enabled:
+            ack_options[OPTION_SACK_PERMITTED] = b''
+        self.mss = DEFAULT_MSS
+        if OPTION_MSS in options:
+            self.mss = max(1, min(int.from_bytes(options[OPTION_MSS], 'big'), self.max_mss, self.max_window_size))
+            ack_options[OPTION_MSS] = self.mss.to_bytes(4, 'big')
+        self.window_scale = 0
+        if OPTION_WINDOW_SCALE in options and header is V2:
+            self.window_scale = window_scale_for(self.max_window_size)
+            ack_options[OPTION_WINDOW_SCALE] = self.window_scale.to_bytes(1, 'big')
+        self.max_win = max(1, self.max_window_size // self.mss)
+        self.stripe = None
+        if OPTION_STRIPE in options and header is V2 and self.accept_stripes:
+            self.stripe = decode_stripe(options[OPTION_STRIPE])
+            if self.stripe is not None:
+                ack_options[OPTION_STRIPE] = options[OPTION_STRIPE]
+        self.resume = None
+        if OPTION_RESUME in options and header is V2 and self.stripe is None:
+            self.resume = decode_resume(options[OPTION_RESUME])
+            if self.resume is not None:
+                file_size, token = self.resume
+                self.checkpoint = Checkpoint(self.filename)
+                self.resume_offset, self.crc32 = self.checkpoint.load(token, file_size)
+                self.received_offset = self.checkpointed_offset = self.resume_offset
+                ack_options[OPTION_RESUME] = encode_resume(self.resume_offset, self.crc32)
+        self.parity_decoder = None
+        if OPTION_FEC in options and header is V2:
+            self.parity_decoder = ParityDecoder(self.seq_modulus, self.max_window_size)
+            ack_options[OPTION_FEC] = b''
+        self.frame_decoder = None
+        self.decompression_error = None
+        if OPTION_COMPRESSION in options and header is V2 and self.resume is None:
+            algorithm = choose_algorithm(options[OPTION_COMPRESSION])
+            if algorithm is not None:
+                self.frame_decoder = FrameDecoder(algorithm)
+                ack_options[OPTION_COMPRESSION] = bytes([algorithm])
+        return ack_options
 
-            elif packet_type == DATA:
+    def open_file_writer(self):
+        """ Appends a whole-file transfer; a stripe writes its range of a file sized for the whole transfer.
 
-                self.log_message("rcv", (time.time() - self.start_time), "DATA", int.from_bytes(packet[2:4]), len(packet[4:])) 
+        A resumable transfer first cuts the file back to its committed offset, dropping whatever
+        was written after the last checkpoint. Any other transfer cuts it back to the size it had
+        when the connection first opened it, so a sender that reconnects starts over cleanly.
+        """
+        flush_threshold = min(WRITER_FLUSH_THRESHOLD, max(1, self.max_window_size // 4))
+        if self.stripe is None:
+            file_writer = StreamingFileWriter(self.filename, flush_threshold, writer_thread=self.writer_thread)
+            if self.resume is not None:
+                os.ftruncate(file_writer.fd, self.resume_offset)
+            elif self.initial_file_size is None:
+                self.initial_file_size = os.fstat(file_writer.fd).st_size
+            else:
+                os.ftruncate(file_writer.fd, self.initial_file_size)
+            return file_writer
+        _, offset, total_size = self.stripe
+        file_writer = StreamingFileWriter(self.filename, flush_threshold, offset=offset, writer_thread=self.writer_thread)
+        if os.fstat(file_writer.fd).st_size != total_size:
+            os.ftruncate(file_writer.fd, total_size)
+        return file_writer
 
-                if seq_number == self.expected_seq_number:
+    def send_ack(self, ack_packet, label="ACK"):
+        started = self.tracer.start("send") if self.tracer is not None else None
+        self.receiver_socket.sendto(ack_packet, self.sender_address)
+        if started is not None:
+            self.tracer.finish("send", started, connection=self.label)
+        if self.advertised_window < self.max_window_size and not self.connection_teardown_flag and self.window_update_deadline is None:
+            self.window_update_deadline = time.monotonic() + self.window_poll_interval
+        self.log_message("snd", (time.time() - self.start_time), label, self.expected_seq_number, len(ack_packet) - self.header.size) 
 
-                    with open(self.filename, 'ab') as file: 
+    def send_data_ack(self):
+        if self.ack_latency is not None:
+            held = time.monotonic() - self.delayed_ack_deadline + self.ack_delay if self.delayed_ack_deadline is not None else 0.0
+            self.ack_latency.observe(held)
+        self.send_ack(self.create_data_ack(), "SACK" if self.sack_enabled else "ACK")
+        self.unacknowledged_in_order_segments = 0
+        self.unacknowledged_in_order_bytes = 0
+        self.delayed_ack_deadline = None
 
-                        file.write(data)
-                    self.expected_seq_number += len(data)
-                    self.expected_seq_number =  self.expected_seq_number % 65536
+    @property
+    def window_poll_interval(self):
+        return max(0.001, self.ack_delay)
 
-                    self.sliding_window = OrderedDict(sorted(self.sliding_window.items()))
+    def next_deadline(self):
+        """ Earliest of the delayed-ACK and window-update timers, or None """
+        deadlines = [deadline for deadline in (self.delayed_ack_deadline, self.window_update_deadline) if deadline is not None]
+        return min(deadlines) if deadlines else None
 
-                    for seq_no, data_of_seq_no in self.sliding_window.items():
-                        if seq_no != self.expected_seq_number:
-                            break
-                        else:
+    def handle_timers(self, now):
+        if self.delayed_ack_deadline is not None and now >= self.delayed_ack_deadline:
+            self.send_data_ack()
+        if self.window_update_deadline is not None and now >= self.window_update_deadline:
+            self.window_update_deadline = None
+            free_window = self.free_window()
+            if free_window - self.advertised_window >= self.mss or free_window == self.max_window_size > self.advertised_window:
+                self.send_ack(self.create_data_ack(), "SACK" if self.sack_enabled else "ACK")
+                self.number_of_window_updates_sent += 1
+            elif self.advertised_window < self.max_window_size:
+                self.window_update_deadline = now + self.window_poll_interval
 
-                            with open(self.filename, 'ab') as file: 
+    def acknowledge_in_order_data(self, filled_a_hole, length):
+        """ Coalesces ACKs: one per ack_every in-order segments, or once the delayed-ACK timer expires.
 
-                                file.write(data_of_seq_no)
+        Once the held bytes reach half the advertised window the ACK goes out at once, since a
+        sender limited by the window cannot send more until it arrives.
+        """
+        self.unacknowledged_in_order_segments += 1
+        self.unacknowledged_in_order_bytes += length
+        if (filled_a_hole or self.unacknowledged_in_order_segments >= self.ack_every
+                or self.unacknowledged_in_order_bytes >= self.advertised_window // 2):
+            self.send_data_ack()
+        elif self.delayed_ack_deadline is None:
+            self.delayed_ack_deadline = time.monotonic() + self.ack_delay
 
-                            self.expected_seq_number = seq_no + len(data_of_seq_no)
-                            self.expected_seq_number = self.expected_seq_number % 65536
+    def deliver_in_order(self, data):
+        if self.parity_decoder is not None:
+            self.parity_decoder.remember(self.expected_seq_number, data)
+        if self.frame_decoder is None:
+            self.write_output(data)
+        elif self.decompression_error is None:
+            try:
+                for block in self.frame_decoder.feed(data):
+                    self.write_output(block)
+            except ValueError as error:
+                self.decompression_error = str(error)
 
-                            self.list_of_packet_seq_numbers_to_be_deleted_from_sliding_window.append(seq_no)
+    def write_output(self, data):
+        self.file_writer.write(data)
+        if self.resume is not None:
+            self.crc32 = zlib.crc32(data, self.crc32)
+            self.received_offset += len(data)
+            if self.received_offset - self.checkpointed_offset >= self.checkpoint_interval:
+                self.commit()
 
-                    for i in self.list_of_packet_seq_numbers_to_be_deleted_from_sliding_window:
-                        del self.sliding_window[i]
+    def accept_in_order(self, data):
+        """ Delivers the expected segment and every buffered one it makes contiguous; returns whether a hole was filled """
+        self.deliver_in_order(data)
+        self.expected_seq_number = (self.expected_seq_number + len(data)) % self.seq_modulus
+        filled_a_hole = False
+        for data_of_seq_no in self.reorder_buffer.advance(self.expected_seq_number):
+            self.deliver_in_order(data_of_seq_no)
+            self.expected_seq_number = (self.expected_seq_number + len(data_of_seq_no)) % self.seq_modulus
+            filled_a_hole = True
+        return filled_a_hole
 
-                    self.list_of_packet_seq_numbers_to_be_deleted_from_sliding_window = [] 
+    def repair_from_parity(self):
+        """ Rebuilds every segment a stored parity pins down, and ACKs at once so the sender need not retransmit """
+        recovered = self.parity_decoder.recover(self.expected_seq_number, self.reorder_buffer.get)
+        for seq_number, data in recovered:
+            if seq_number == self.expected_seq_number:
+                self.accept_in_order(data)
+            else:
+                self.reorder_buffer.insert(seq_number, data)
+            self.number_of_segments_recovered_by_parity += 1
+        if recovered:
+            self.send_data_ack()
 
-                    self.sliding_window = OrderedDict(sorted(self.sliding_window.items()))
+    def commit(self):
+        """ Makes everything received so far durable, then records it in the checkpoint """
+        self.file_writer.flush()
+        os.fsync(self.file_writer.fd)
+        file_size, token = self.resume
+        self.checkpoint.save(token, file_size, self.received_offset, self.crc32)
+        self.checkpointed_offset = self.received_offset
 
-                    ack_packet = self.create_packet(ACK, self.expected_seq_number)
+    def verify_transfer(self, fin_payload):
+        """ Compares the sender's whole-file crc32 from the FIN with the file on disk; the checkpoint is no longer needed """
+        self.file_writer.flush()
+        os.fsync(self.file_writer.fd)
+        file_size, _ = self.resume
+        self.hash_verified = (len(fin_payload) >= 4 and os.fstat(self.file_writer.fd).st_size == file_size
+                              and int.from_bytes(fin_payload[:4], 'big') == file_crc32(self.filename, file_size))
+        self.checkpoint.remove()
+        return bytes([1 if self.hash_verified else 0])
 
-                    self.receiver_socket.sendto(ack_packet, self.sender_address) 
-                    self.log_message("snd", (time.time() - self.start_time), "ACK", int.from_bytes(ack_packet[2:4]), len(ack_packet[4:])) 
+    def verify_decompression(self):
+        """ Status byte for the FIN ACK of a compressed transfer: 1 if every block decompressed and the stream ended on a frame boundary """
+        if self.decompression_error is None and self.frame_decoder.partial_frame:
+            self.decompression_error = "stream ended inside a block"
+        return bytes([1 if self.decompression_error is None else 0])
+
+    @property
+    def transfer_failed(self):
+        return self.hash_verified is False or self.decompression_error is not None
+
+    def handle_packet(self, packet):
+        self.last_activity = time.monotonic()
+        header = header_format_of(packet)
+        packet_type, seq_number, _ = header.unpack(packet)
+        data = packet[header.size:] 
+        if self.connection_teardown_flag:
+            if packet_type == FIN and self.fin_ack is not None:
+                self.log_message("rcv", (time.time() - self.start_time), "FIN", seq_number, len(data)) 
+                self.send_ack(self.fin_ack)
+            return
+
+        if packet_type == SYN:
+            self.log_message("rcv", (time.time() - self.start_time), "SYN", seq_number, 0) 
+            if self.syn_ack_options is not None and seq_number == self.isn:
+                self.send_ack(self.create_packet(ACK, self.expected_seq_number) + encode_options(self.syn_ack_options))
+                return
+            if self.file_writer is not None:
+                self.close_file_writer()
+            ack_options = self.negotiate_options(header, data)
+            self.syn_ack_options = ack_options
+            self.isn = seq_number
+            self.expected_seq_number = (seq_number + 1) % self.seq_modulus
+            self.reorder_buffer = ReorderBuffer(self.seq_modulus, self.max_window_size)
+            self.reorder_buffer.reset(self.expected_seq_number)
+            self.file_writer = self.open_file_writer()
+
+            self.send_ack(self.create_packet(ACK, self.expected_seq_number) + encode_options(ack_options))
+
+        elif packet_type == DATA:
+
+            self.log_message("rcv", (time.time() - self.start_time), "DATA", seq_number, len(data)) 
+            if self.file_writer is None:
+                return
+            if not data:
+                self.number_of_window_probes_received += 1
+                self.send_data_ack()
+                return
+
+            if seq_number == self.expected_seq_number:
+
+                filled_a_hole = self.accept_in_order(bytes(data))
+                self.acknowledge_in_order_data(filled_a_hole, len(data))
+                self.number_of_original_data_segments_received += 1
+                self.amount_of_original_data_received += len(data)
+
+            else: 
+
+                if len(self.reorder_buffer) < self.max_win and self.reorder_buffer.insert(seq_number, bytes(data)):
                     self.number_of_original_data_segments_received += 1
                     self.amount_of_original_data_received += len(data)
+                else:
+                    self.number_of_duplicate_data_segments_received += 1
 
-                else: 
+                self.send_data_ack()
+                self.number_of_duplicate_acknowledgments_sent += 1
 
-                    self.number_of_duplicate_data_segments_received += 1
+            if self.parity_decoder is not None and self.parity_decoder.blocks:
+                self.repair_from_parity()
 
-                    if (len(self.sliding_window) < self.max_win): 
-                        self.sliding_window[seq_number] = data    
+        elif packet_type == PARITY:
 
-                    self.expected_seq_number =  self.expected_seq_number % 65536
-                    ack_packet = self.create_packet(ACK, self.expected_seq_number)
-                    self.receiver_socket.sendto(ack_packet, self.sender_address)
-                    self.log_message("snd", (time.time() - self.start_time), "ACK", int.from_bytes(ack_packet[2:4]), len(ack_packet[4:])) 
-                    self.number_of_duplicate_acknowledgments_sent += 1
+            self.log_message("rcv", (time.time() - self.start_time), "PARITY", seq_number, len(data))
+            if self.file_writer is None or self.parity_decoder is None:
+                return
+            if self.parity_decoder.add(seq_number, data):
+                self.number_of_parity_segments_received += 1
+                self.repair_from_parity()
 
-            elif packet_type == FIN:
+        elif packet_type == FIN:
 
-                self.log_message("rcv", (time.time() - self.start_time), "FIN", int.from_bytes(packet[2:4]), len(packet[4:])) 
+            self.log_message("rcv", (time.time() - self.start_time), "FIN", seq_number, len(data)) 
 
-                self.expected_seq_number =  (seq_number + 1) % 65536
-                ack_packet = self.create_packet(ACK, self.expected_seq_number)
-                self.receiver_socket.sendto(ack_packet, self.sender_address)
-                self.log_message("snd", (time.time() - self.start_time), "ACK", int.from_bytes(ack_packet[2:4]), len(ack_packet[4:])) 
+            self.expected_seq_number =  (seq_number + 1) % self.seq_modulus
+            self.fin_ack = self.create_packet(ACK, self.expected_seq_number)
+            if self.resume is not None and self.file_writer is not None:
+                self.fin_ack += self.verify_transfer(data)
+            elif self.frame_decoder is not None:
+                self.fin_ack += self.verify_decompression()
+            self.send_ack(self.fin_ack)
+            self.close()
 
-                self.connection_teardown_flag = 1
-                with open(self.log_filename, 'a') as file:  
-                    file.write(f"Original data received:  {self.amount_of_original_data_received}\n")
-                    file.write(f"Original segments received: {self.number_of_original_data_segments_received}\n")
-                    file.write(f"Dup data segments received: {self.number_of_duplicate_data_segments_received}\n")
-                    file.write(f"Dup ack segments sent: {self.number_of_duplicate_acknowledgments_sent}\n")
+        else: 
+            pass 
 
-                self.receiver_socket.close()
+    def summary_lines(self):
+        lines = [
+            f"Original data received:  {self.amount_of_original_data_received}",
+            f"Original segments received: {self.number_of_original_data_segments_received}",
+            f"Dup data segments received: {self.number_of_duplicate_data_segments_received}",
+            f"Dup ack segments sent: {self.number_of_duplicate_acknowledgments_sent}",
+        ]
+        if self.number_of_window_probes_received or self.number_of_window_updates_sent:
+            lines.append(f"Window probes received: {self.number_of_window_probes_received}")
+            lines.append(f"Window updates sent: {self.number_of_window_updates_sent}")
+        if self.stripe is not None:
+            lines.append(f"Stripe offset: {self.stripe[1]} of {self.stripe[2]}")
+        if self.parity_decoder is not None:
+            lines.append(f"Parity segments received: {self.number_of_parity_segments_received}")
+            lines.append(f"Segments recovered by parity: {self.number_of_segments_recovered_by_parity}")
+        if self.frame_decoder is not None:
+            lines.append(f"Compression: {ALGORITHM_NAMES[self.frame_decoder.algorithm]}")
+            lines.append(f"Decompressed data written: {self.frame_decoder.amount_of_output_in_bytes}")
+            lines.append(f"Decompression CPU time (s): {round(self.frame_decoder.cpu_time, 3)}")
+            if self.decompression_error is not None:
+                lines.append(f"Decompression error: {self.decompression_error}")
+        if self.resume is not None:
+            lines.append(f"Resumed from offset: {self.resume_offset}")
+            if self.hash_verified is not None:
+                lines.append(f"Hash check: {'ok' if self.hash_verified else 'MISMATCH'}")
+        if self.output_error is not None:
+            lines.append(f"Output error: {self.output_error}")
+        return lines
 
-            else: 
-                pass 
+    def close_file_writer(self):
+        """ Closes the output file, first checkpointing an unfinished resumable transfer """
+        if self.resume is not None and self.hash_verified is None:
+            self.commit()
+        self.file_writer.close()
+        self.file_writer = None
+
+    def abort(self, error):
+        """ Gives up on a connection whose output file failed: the file is closed without flushing or checkpointing """
+        self.output_error = error
+        self.connection_teardown_flag = 1
+        self.delayed_ack_deadline = None
+        self.window_update_deadline = None
+        if self.file_writer is not None:
+            self.file_writer.abort()
+            self.file_writer = None
+        self.reorder_buffer = ReorderBuffer(self.seq_modulus, self.max_window_size)
+        if self.parity_decoder is not None:
+            self.parity_decoder = ParityDecoder(self.seq_modulus, self.max_window_size)
+
+    def close(self):
+        """ Flushes and closes the output file, checkpointing an unfinished resumable transfer, and drops the buffered segments """
+        self.connection_teardown_flag = 1
+        self.delayed_ack_deadline = None
+        self.window_update_deadline = None
+        if self.file_writer is not None:
+            self.close_file_writer()
+        self.reorder_buffer = ReorderBuffer(self.seq_modulus, self.max_window_size)
+        if self.parity_decoder is not None:
+            self.parity_decoder = ParityDecoder(self.seq_modulus, self.max_window_size)
+
+def register_connection_metrics(registry, connections, ack_latency, tracer):
+    """ Per-connection counters and gauges, labelled by sender address; connections returns the live ones """
+    def collect(read):
+        return lambda: [({"connection": connection.label}, read(connection)) for connection in connections()]
+
+    registry.counter("receiver_original_bytes_received_total", "Original data received in bytes",
+                     collect(lambda connection: connection.amount_of_original_data_received))
+    registry.counter("receiver_original_segments_received_total", "Original DATA segments received",
+                     collect(lambda connection: connection.number_of_original_data_segments_received))
+    registry.counter("receiver_duplicate_segments_received_total", "Duplicate DATA segments received",
+                     collect(lambda connection: connection.number_of_duplicate_data_segments_received))
+    registry.counter("receiver_duplicate_acks_sent_total", "Duplicate ACKs sent",
+                     collect(lambda connection: connection.number_of_duplicate_acknowledgments_sent))
+    registry.counter("receiver_parity_recovered_segments_total", "DATA segments rebuilt from parity instead of retransmitted",
+                     collect(lambda connection: connection.number_of_segments_recovered_by_parity))
+    registry.gauge("receiver_reorder_buffer_segments", "Out-of-order segments held in the reorder buffer",
+                   collect(lambda connection: len(connection.reorder_buffer)))
+    registry.gauge("receiver_writer_pending_bytes", "In-order bytes waiting for the next write",
+                   collect(lambda connection: connection.file_writer.pending_bytes if connection.file_writer is not None else 0))
+    registry.gauge("receiver_writer_backlog_bytes", "Bytes handed to the writer thread but not yet written",
+                   collect(lambda connection: connection.file_writer.backlog_bytes if connection.file_writer is not None else 0))
+    registry.gauge("receiver_advertised_window_bytes", "Receive window advertised in the latest ACK",
+                   collect(lambda connection: connection.advertised_window))
+    registry.gauge("receiver_throughput_bytes_per_second", "Original bytes received per second since the previous scrape",
+                   collect(lambda connection: connection.throughput()))
+    registry.histogram("receiver_ack_latency_seconds", "Time an in-order segment waited for its (possibly delayed) ACK",
+                       lambda: ack_latency)
+    if tracer is not None:
+        tracer.register_metrics(registry, "receiver")
+
+class Receiver:
+    """ Single-transfer receiver: one socket, one connection, exits after the FIN """
+
+    def __init__(self, receiver_port, sender_port, filename, max_window_size, log_mode=FULL, max_mss=MAX_MSS,
+                 ack_every=2, ack_delay=0.005, tracer=None, checkpoint_interval=8 * 1024 * 1024):
+        self.receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver_socket.bind(('localhost', receiver_port))
+        enlarge_socket_buffers(self.receiver_socket)
+        self.batch_receiver = BatchReceiver(self.receiver_socket)
+        self.sender_address = ('localhost', sender_port)
+        self.log_filename = f"receiver_log.txt"
+        self.logger = SegmentLogger(self.log_filename, log_mode)
+        self.tracer = tracer
+        self.ack_latency = Histogram(ACK_LATENCY_BUCKETS)
+        self.writer_thread = WriterThread()
+        self.connection = ReceiverConnection(self.receiver_socket, self.sender_address, filename, max_window_size,
+                                             self.logger, max_mss, ack_every, ack_delay, self.ack_latency, tracer,
+                                             checkpoint_interval, writer_thread=self.writer_thread)
+
+    def register_metrics(self, registry):
+        register_connection_metrics(registry, lambda: [self.connection], self.ack_latency, self.tracer)
+
+    def handle_packets(self):
+        """ Waits for datagrams or the delayed-ACK timer, then drains every pending datagram in one batch """
+        connection = self.connection
+        connection.start_time = time.time()
+        self.receiver_socket.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.receiver_socket, selectors.EVENT_READ)
+        try:
+            while connection.connection_teardown_flag == 0:
+                timeout = None
+                deadline = connection.next_deadline()
+                if deadline is not None:
+                    timeout = max(0, deadline - time.monotonic())
+                if selector.select(timeout):
+                    started = self.tracer.start("receive") if self.tracer is not None else None
+                    datagrams = self.batch_receiver.receive_batch()
+                    for packet, _ in datagrams:
+                        connection.handle_packet(packet)
+                        if connection.connection_teardown_flag:
+                            break
+                    if started is not None:
+                        self.tracer.finish("receive", started, datagrams=len(datagrams))
+                if connection.next_deadline() is not None:
+                    connection.handle_timers(time.monotonic())
+        except KeyboardInterrupt:
+            connection.close()
+        self.writer_thread.close()
+        selector.close()
+        self.logger.close(connection.summary_lines())
+        self.receiver_socket.close()
+
+class ReceiverServer:
+    """ Receives concurrent transfers on one port, demultiplexed by source address and ISN.
+
+    Each sender address maps to one ReceiverConnection; a SYN carrying a new ISN from a known
+    address replaces the old connection. Finished connections linger for time_wait seconds
+    to answer retransmitted FINs, and connections silent for idle_timeout seconds are
+    evicted, so memory is bounded by the number of active transfers. With reuse_port,
+    several worker processes can bind the same port and the kernel spreads senders
+    across them by address.
+    """
+
+    def __init__(self, receiver_port, filename_template, max_window_size, log_mode=FULL, max_mss=MAX_MSS,
+                 ack_every=2, ack_delay=0.005, idle_timeout=30.0, time_wait=2.0, log_filename="receiver_log.txt",
+                 reuse_port=False, host='localhost', tracer=None, checkpoint_interval=8 * 1024 * 1024):
+        self.receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            self.receiver_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.receiver_socket.bind((host, receiver_port))
+        enlarge_socket_buffers(self.receiver_socket)
+        self.batch_receiver = BatchReceiver(self.receiver_socket)
+        self.filename_template = filename_template
+        self.max_window_size = max_window_size
+        self.max_mss = max_mss
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.idle_timeout = idle_timeout
+        self.time_wait = time_wait
+        self.logger = SegmentLogger(log_filename, log_mode)
+        self.tracer = tracer
+        self.ack_latency = Histogram(ACK_LATENCY_BUCKETS)
+        self.checkpoint_interval = checkpoint_interval
+        self.writer_thread = WriterThread()
+        self.connections = {}
+        self.timer_connections = set()
+        self.number_of_connections_completed = 0
+        self.number_of_connections_evicted = 0
+        self.number_of_connections_failed = 0
+        self.running = True
+
+    def connection_filename(self, address, isn, stripe=None, resume=None):
+        """ Output file for one transfer; the template may use {host}, {port}, {isn} and {transfer}.
+
+        Every stripe of a striped transfer maps to the same file, named after the transfer id, and a
+        resumable transfer is named after its file token so a reconnecting sender finds it again.
+        """
+        host, port = address[:2]
+        if stripe is not None:
+            transfer = f"{stripe[0]:016x}"
+        elif resume is not None:
+            transfer = f"{resume[0]}_{resume[1]:08x}"
+        else:
+            transfer = f"{isn}"
+        if '{' in self.filename_template:
+            return self.filename_template.format(host=host, port=port, isn=isn, transfer=transfer)
+        stem, extension = os.path.splitext(self.filename_template)
+        if stripe is not None or resume is not None:
+            return f"{stem}_{transfer}{extension}"
+        return f"{stem}_{host}_{port}_{isn}{extension}"
+
+    def open_connection(self, address, isn, syn_payload):
+        stripe = None
+        resume = None
+        options = decode_options(syn_payload)
+        if OPTION_STRIPE in options:
+            stripe = decode_stripe(options[OPTION_STRIPE])
+        elif OPTION_RESUME in options:
+            resume = decode_resume(options[OPTION_RESUME])
+        connection = ReceiverConnection(self.receiver_socket, address, self.connection_filename(address, isn, stripe, resume),
+                                        self.max_window_size, self.logger, self.max_mss, self.ack_every, self.ack_delay,
+                                        self.ack_latency, self.tracer, self.checkpoint_interval, accept_stripes=True,
+                                        writer_thread=self.writer_thread)
+        self.connections[address] = connection
+        return connection
+
+    def finish_connection(self, address, connection, reason):
+        """ Closes a connection that has not seen its FIN and records its statistics """
+        del self.connections[address]
+        self.timer_connections.discard(connection)
+        if not connection.connection_teardown_flag:
+            try:
+                connection.close()
+            except OSError as error:
+                self.fail_connection(connection, error)
+                return
+            self.logger.note([f"Connection {address[0]}:{address[1]} ISN {connection.isn} {reason}"] + connection.summary_lines())
+
+    def fail_connection(self, connection, error):
+        """ Evicts a connection whose output file failed (a full or broken disk) and logs why; other transfers carry on """
+        address = connection.sender_address
+        if self.connections.get(address) is connection:
+            del self.connections[address]
+        self.timer_connections.discard(connection)
+        connection.abort(error)
+        self.number_of_connections_failed += 1
+        self.logger.note([f"Connection {address[0]}:{address[1]} ISN {connection.isn} failed"] + connection.summary_lines())
+
+    def handle_datagram(self, packet, address):
+        header = header_format_of(packet)
+        if len(packet) < header.size:
+            return
+        packet_type, seq_number, _ = header.unpack(packet)
+        connection = self.connections.get(address)
+        if packet_type == SYN and (connection is None or connection.isn != seq_number):
+            if connection is not None:
+                self.finish_connection(address, connection, "replaced by a new SYN")
+            connection = self.open_connection(address, seq_number, packet[header.size:])
+        elif connection is None:
+            return
+
+        try:
+            connection.handle_packet(packet)
+        except OSError as error:
+            self.fail_connection(connection, error)
+            return
+        if connection.next_deadline() is not None:
+            self.timer_connections.add(connection)
+        if connection.connection_teardown_flag and packet_type == FIN and connection.isn is not None:
+            self.number_of_connections_completed += 1
+            self.logger.note([f"Connection {address[0]}:{address[1]} ISN {connection.isn} completed"] + connection.summary_lines())
+            connection.isn = None
+
+    def run_connection_timers(self, now):
+        """ Sends due delayed ACKs and window updates; connections stay in the set while a timer is armed """
+        for connection in list(self.timer_connections):
+            deadline = connection.next_deadline()
+            if deadline is not None and now >= deadline:
+                try:
+                    connection.handle_timers(now)
+                except OSError as error:
+                    self.fail_connection(connection, error)
+                    continue
+                deadline = connection.next_deadline()
+            if deadline is None:
+                self.timer_connections.discard(connection)
+
+    def sweep_connections(self, now):
+        """ Evicts finished connections after time_wait and silent ones after idle_timeout """
+        for address, connection in list(self.connections.items()):
+            idle = now - connection.last_activity
+            if connection.connection_teardown_flag and idle >= self.time_wait:
+                self.finish_connection(address, connection, "closed")
+            elif idle >= self.idle_timeout:
+                self.number_of_connections_evicted += 1
+                self.finish_connection(address, connection, "evicted after idle timeout")
+            elif connection.file_writer is not None and idle >= 1.0:
+                try:
+                    connection.file_writer.flush_soon()
+                except OSError as error:
+                    self.fail_connection(connection, error)
+
+    def serve_forever(self):
+        self.receiver_socket.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.receiver_socket, selectors.EVENT_READ)
+        next_sweep = time.monotonic() + 1.0
+        try:
+            while self.running:
+                deadline = next_sweep
+                for connection in self.timer_connections:
+                    connection_deadline = connection.next_deadline()
+                    if connection_deadline is not None:
+                        deadline = min(deadline, connection_deadline)
+                if selector.select(max(0, deadline - time.monotonic())):
+                    started = self.tracer.start("receive") if self.tracer is not None else None
+                    datagrams = self.batch_receiver.receive_batch()
+                    for packet, address in datagrams:
+                        self.handle_datagram(packet, address)
+                    if started is not None:
+                        self.tracer.finish("receive", started, datagrams=len(datagrams))
+                now = time.monotonic()
+                if self.timer_connections:
+                    self.run_connection_timers(now)
+                if now >= next_sweep:
+                    self.sweep_connections(now)
+                    next_sweep = now + 1.0
+        except KeyboardInterrupt:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        finally:
+            selector.close()
+            self.shutdown()
+
+    def register_metrics(self, registry):
+        registry.gauge("receiver_connections", "Connections currently held, including those in time-wait",
+                       lambda: len(self.connections))
+        registry.counter("receiver_connections_completed_total", "Connections closed by a FIN",
+                         lambda: self.number_of_connections_completed)
+        registry.counter("receiver_connections_evicted_total", "Connections evicted after the idle timeout",
+                         lambda: self.number_of_connections_evicted)
+        registry.counter("receiver_connections_failed_total", "Connections evicted after their output file failed",
+                         lambda: self.number_of_connections_failed)
+        register_connection_metrics(registry, lambda: list(self.connections.values()), self.ack_latency, self.tracer)
+
+    def shutdown(self):
+        for address, connection in list(self.connections.items()):
+            self.finish_connection(address, connection, "closed at shutdown")
+        self.writer_thread.close()
+        self.logger.close([
+            f"Connections completed: {self.number_of_connections_completed}",
+            f"Connections evicted: {self.number_of_connections_evicted}",
+            f"Connections failed: {self.number_of_connections_failed}",
+        ])
+        self.receiver_socket.close()
+
+def run_server_worker(args, log_filename, reuse_port, index=0):
+    tracer = create_tracer(args)
+    server = ReceiverServer(args.receiver_port, args.txt_file_received, args.max_win, args.log_mode, args.max_mss,
+                            args.ack_every, args.ack_delay / 1000, args.idle_timeout, log_filename=log_filename,
+                            reuse_port=reuse_port, tracer=tracer, checkpoint_interval=args.checkpoint_interval)
+    metrics_server = serve_metrics(args, server, index)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        if tracer is not None:
+            tracer.close()
+
+def serve(args):
+    """ Runs the server in this process, or in --workers processes sharing the port through SO_REUSEPORT """
+    if args.workers <= 1:
+        run_server_worker(args, "receiver_log.txt", False)
+        return
+    workers = [multiprocessing.Process(target=run_server_worker, args=(args, f"receiver_log_{index}.txt", True, index))
+               for index in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="receiver.py", usage="python receiver.py receiver_port sender_port txt_file_received max_win [options]")
+    parser.add_argument("receiver_port", type=int)
+    parser.add_argument("sender_port", type=int, help="ignored with --server, which replies to each sender's address")
+    parser.add_argument("txt_file_received", help="with --server, a template for per-connection files ({host}, {port}, {isn}, {transfer})")
+    parser.add_argument("max_win", type=int)
+    parser.add_argument("--log-mode", choices=LOG_MODES, default=FULL, help="full event trace, summary counters only, or no log file")
+    parser.add_argument("--max-mss", type=int, default=MAX_MSS, help="largest segment size to accept in the SYN exchange")
+    parser.add_argument("--ack-every", type=int, default=2, help="acknowledge every N in-order segments (1 disables coalescing)")
+    parser.add_argument("--ack-delay", type=float, default=5, help="longest time in ms an in-order segment waits for its ACK")
+    parser.add_argument("--server", action="store_true", help="keep receiving concurrent transfers on the port until interrupted")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes sharing the port with SO_REUSEPORT")
+    parser.add_argument("--idle-timeout", type=float, default=30, help="seconds of silence before a server connection is evicted")
+    parser.add_argument("--checkpoint-interval", type=int, default=8 * 1024 * 1024,
+                        help="bytes between fsynced checkpoints of a resumable transfer")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
 
 def main():
-    if len(sys.argv) != 5:
-        print("Usage: python receiver.py receiver_port sender_port txt_file_received max_win")
-        sys.exit(1)
+    args = parse_arguments(sys.argv[1:])
 
-    receiver_port = int(sys.argv[1])
-    sender_port = int(sys.argv[2])
-    txt_file_received = sys.argv[3]
-    max_window_size = int(sys.argv[4])
+    if args.server:
+        serve(args)
+        return
 
-    receiver = Receiver(receiver_port, sender_port, txt_file_received, max_window_size)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    tracer = create_tracer(args)
+    receiver = Receiver(args.receiver_port, args.sender_port, args.txt_file_received, args.max_win, args.log_mode, args.max_mss,
+                        args.ack_every, args.ack_delay / 1000, tracer, args.checkpoint_interval)
+    metrics_server = serve_metrics(args, receiver)
 
-    receiver.handle_packets()
+    try:
+        receiver.handle_packets()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        if tracer is not None:
+            tracer.close()
+    if receiver.connection.transfer_failed:
+        sys.exit(f"receiver.py: error: the received file is damaged, see {receiver.log_filename}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
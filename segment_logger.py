@@ -0,0 +1,106 @@
+import threading
+from collections import Counter, deque
+
+FULL = "full"
+COUNTERS = "counters"
+OFF = "off"
+LOG_MODES = (FULL, COUNTERS, OFF)
+
+class SegmentLogger:
+    """ Buffered segment logger shared by the sender and the receiver.
+
+    Event records are queued in a bounded ring buffer and written by a background
+    writer thread through one long-lived file handle. close() drains the buffer
+    before the summary block is written, so the summary always follows the events.
+    """
+
+    def __init__(self, log_filename, mode=FULL, capacity=8192, batch_size=256, flush_interval=0.05):
+        if mode not in LOG_MODES:
+            raise ValueError(f"unknown log mode {mode!r}, expected one of {', '.join(LOG_MODES)}")
+        self.log_filename = log_filename
+        self.mode = mode
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.records = deque()
+        self.event_counts = Counter()
+        self.notes = []
+        self.condition = threading.Condition()
+        self.closing = False
+        self.closed = False
+
+        self.file = None
+        self.writer = None
+        if self.mode != OFF:
+            self.file = open(self.log_filename, 'a')
+        if self.mode == FULL:
+            self.writer = threading.Thread(target=self.writer_thread, daemon=True)
+            self.writer.start()
+
+    def log(self, direction, time, type, sequence_number, length):
+        """ Queues one snd/rcv/drp event, blocking only while the ring buffer is full """
+        if self.mode == FULL:
+            with self.condition:
+                while len(self.records) >= self.capacity and not self.closing:
+                    self.condition.notify_all()
+                    self.condition.wait()
+                self.records.append((direction, time, type, sequence_number, length))
+                if len(self.records) >= self.batch_size:
+                    self.condition.notify_all()
+        elif self.mode == COUNTERS:
+            with self.condition:
+                self.event_counts[(direction, type)] += 1
+
+    def note(self, lines):
+        """ Queues free-form lines (such as one connection's summary) in order with the events """
+        if self.mode == OFF:
+            return
+        with self.condition:
+            if self.mode == FULL:
+                self.records.extend(lines)
+            else:
+                self.notes.extend(lines)
+
+    def format_records(self, records):
+        return "".join(f"{record}\n" if isinstance(record, str) else
+                       f"{record[0]}    {round(record[1]*1000,2)}    {record[2]}  {record[3]}   {record[4]}\n"
+                       for record in records)
+
+    def writer_thread(self):
+        while True:
+            with self.condition:
+                if len(self.records) < self.batch_size and not self.closing:
+                    self.condition.wait(self.flush_interval)
+                if not self.records:
+                    if self.closing:
+                        break
+                    continue
+                batch = self.records
+                self.records = deque()
+                self.condition.notify_all()
+            self.file.write(self.format_records(batch))
+            self.file.flush()
+
+    def close(self, summary_lines=()):
+        """ Flushes every queued event, then appends the summary lines and closes the file """
+        if self.closed:
+            return
+        self.closed = True
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        if self.writer is not None:
+            self.writer.join()
+        if self.file is None:
+            return
+        if self.records:
+            self.file.write(self.format_records(self.records))
+            self.records.clear()
+        for (direction, type), count in sorted(self.event_counts.items()):
+            self.file.write(f"{direction} {type} events: {count}\n")
+        for line in self.notes:
+            self.file.write(f"{line}\n")
+        for line in summary_lines:
+            self.file.write(f"{line}\n")
+        self.file.close()
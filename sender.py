@@ -1,34 +1,202 @@
+import argparse
+import heapq
+import mmap
+import os
 import socket
 import sys
 import threading
 import time
-import datetime
 import random
+import zlib
+import selectors
 from collections import OrderedDict
-
-SYN = 2
-FIN = 3
-DATA = 0
-ACK = 1
-HEADER_SIZE = 4
-MSS = 1000
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_io import BatchReceiver, BatchSender, enlarge_socket_buffers
+from block_compression import ALGORITHM_NAMES, BlockCompressor, supported_algorithms
+from congestion import CONGESTION_CONTROLLERS, create_congestion_controller
+from fec import BlockSizeController, ParityEncoder
+from impairment import BernoulliLoss, ImpairedChannel, Impairment, add_impairment_arguments, create_impairment
+from metrics import ACK_LATENCY_BUCKETS, Histogram, Rate, add_metrics_arguments, create_tracer, serve_metrics
+from protocol import (ACK, DATA, DEFAULT_MSS, FIN, MAX_MSS, OPTION_COMPRESSION, OPTION_FEC, OPTION_MSS, OPTION_RESUME,
+                      OPTION_SACK_PERMITTED, OPTION_STRIPE, OPTION_WINDOW_SCALE, PACKET_TYPE_NAMES, PARITY, PARITY_LAYOUT, RECV_BUFFER_SIZE,
+                      SACK, SYN, V1, V2,
+                      decode_options, decode_resume, decode_sack_blocks, encode_options, encode_resume, encode_stripe)
+from segment_logger import FULL, LOG_MODES, SegmentLogger
+
+DUP_ACK_THRESHOLD = 3
+MAX_FIN_ATTEMPTS = 3
+MAX_SYN_ATTEMPTS = 8
+DEFAULT_SEGMENTS_PER_WINDOW = 16
+
+class RtoEstimator:
+    """ RFC 6298 retransmission timeout estimator with exponential backoff.
+
+    As in Linux, the backoff is cleared as soon as an ACK acknowledges new data,
+    so a run of retransmitted (and therefore unsampled) segments cannot leave the
+    timer backed off for the rest of the transfer.
+    """
+
+    def __init__(self, initial_rto, max_rto=60.0, clock_granularity=0.001):
+        self.min_rto = initial_rto
+        self.max_rto = max(max_rto, initial_rto)
+        self.clock_granularity = clock_granularity
+        self.base_rto = initial_rto
+        self.backoffs = 0
+        self.srtt = None
+        self.rttvar = None
+
+    @property
+    def rto(self):
+        return min(self.max_rto, self.base_rto * (2 ** self.backoffs))
+
+    def add_sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.base_rto = min(self.max_rto, max(self.min_rto, self.srtt + max(self.clock_granularity, 4 * self.rttvar)))
+        self.backoffs = 0
+
+    def backoff(self):
+        if self.rto < self.max_rto:
+            self.backoffs += 1
+
+    def reset_backoff(self):
+        self.backoffs = 0
+
+class RetransmissionTimers:
+    """ Per-segment retransmission deadlines kept in a binary heap keyed by sequence number.
+
+    Cancelling only forgets the deadline; the stale heap entry is discarded lazily when it
+    surfaces, and the heap is rebuilt once stale entries outnumber the live ones, so every
+    operation stays O(log n) in the number of segments in flight.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, seq_number, deadline):
+        self.deadlines[seq_number] = deadline
+        heapq.heappush(self.heap, (deadline, seq_number))
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.compact()
+
+    def cancel(self, seq_number):
+        self.deadlines.pop(seq_number, None)
+
+    def clear(self):
+        self.heap.clear()
+        self.deadlines.clear()
+
+    def compact(self):
+        self.heap = [(deadline, seq_number) for seq_number, deadline in self.deadlines.items()]
+        heapq.heapify(self.heap)
+
+    def discard_stale(self):
+        while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_deadline(self):
+        self.discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def pop_expired(self, now):
+        """ Removes and returns the sequence numbers whose deadline has passed, oldest first """
+        expired = []
+        self.discard_stale()
+        while self.heap and self.heap[0][0] <= now:
+            _, seq_number = heapq.heappop(self.heap)
+            del self.deadlines[seq_number]
+            expired.append(seq_number)
+            self.discard_stale()
+        return expired
+
+class Segment:
+    """ An unacknowledged DATA segment held in the sender's sliding window """
+    __slots__ = ("header", "data", "sent_at", "retransmitted", "timeouts", "sacked", "reported_missing")
+
+    def __init__(self, header, data):
+        self.header = header
+        self.data = data
+        self.sent_at = 0.0
+        self.retransmitted = False
+        self.timeouts = 0
+        self.sacked = False
+        self.reported_missing = False
+
+def default_mss_for(window_bytes):
+    """ DEFAULT_MSS, raised only for windows large enough to still hold DEFAULT_SEGMENTS_PER_WINDOW segments.
+
+    A window of a few segments cannot raise three duplicate ACKs after a loss, which leaves
+    recovery to the retransmission timer.
+    """
+    return max(DEFAULT_MSS, min(MAX_MSS, window_bytes // DEFAULT_SEGMENTS_PER_WINDOW))
 
 class Sender:
-    def __init__(self, sender_port, receiver_port, filename, max_window_size, rto, flp, rlp):
+    def __init__(self, sender_port, receiver_port, filename, max_window_size, rto, flp, rlp, log_mode=FULL, sack=True,
+                 congestion_control="reno", cwnd_log_filename=None, mss=None, compat=False, stripe=None,
+                 log_filename="sender_log.txt", forward_impairment=None, reverse_impairment=None, tracer=None,
+                 resume=False, fec=False, fec_block_size=None, compression_level=None):
         self.sender_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sender_socket.bind(('localhost', sender_port))
+        enlarge_socket_buffers(self.sender_socket)
+        self.batch_sender = BatchSender(self.sender_socket)
+        self.batch_receiver = BatchReceiver(self.sender_socket)
+        self.pending_datagrams = []
         self.receiver_address = ('localhost', receiver_port)
         self.filename = filename
-        self.max_win = max_window_size/1000
-        self.rto = rto / 1000  
+        self.stripe = stripe
+        self.resume_requested = resume
+        self.resume_enabled = False
+        self.resume_offset = 0
+        self.hash_verified = None
+        self.fec_requested = fec
+        self.fec_block_size = fec_block_size
+        self.parity_encoder = None
+        self.block_size_controller = None
+        self.parity_block_ends = deque()
+        self.compression_level = compression_level
+        self.compression_algorithm = None
+        self.compressor = None
+        self.decompression_verified = None
+        self.header = V1 if compat else V2
+        self.seq_modulus = self.header.seq_modulus
+        if compat:
+            max_window_size = min(max_window_size, self.seq_modulus // 2)
+        self.max_window_size = max_window_size
+        self.mss_is_default = mss is None
+        if mss is None:
+            mss = DEFAULT_MSS if compat else default_mss_for(max_window_size)
+        self.mss = max(1, min(mss, max_window_size, MAX_MSS))
+        self.max_win = max(1, max_window_size // self.mss)
+        self.receive_window = max_window_size
+        self.peer_window_scale = None
+        self.persist_deadline = None
+        self.persist_backoffs = 0
+        self.rto_estimator = RtoEstimator(rto / 1000)
         self.flp = flp
         self.rlp = rlp
-        self.isn = random.randint(0, 65535) 
-        self.next_seq_num = (self.isn + 1) % 65536 
-
-        self.log_filename = f"sender_log.txt"
-
-        self.timeout_timer = threading.Timer(self.rto, self.timeout_thread) 
+        if forward_impairment is None:
+            forward_impairment = Impairment(BernoulliLoss(flp, random.Random()))
+        if reverse_impairment is None:
+            reverse_impairment = Impairment(BernoulliLoss(rlp, random.Random()))
+        self.outbound = ImpairedChannel(forward_impairment, self.queue_datagram, self.log_dropped_datagram)
+        self.inbound = ImpairedChannel(reverse_impairment, self.handle_ack, self.log_dropped_ack)
+        self.isn = random.randrange(self.seq_modulus) 
+        self.next_seq_num = (self.isn + 1) % self.seq_modulus 
+
+        self.log_filename = log_filename
+        self.logger = SegmentLogger(self.log_filename, log_mode)
+
+        self.retransmission_timers = RetransmissionTimers()
         self.connection_teardown_event = threading.Event() 
         self.all_data_has_been_read_from_file_flag = 0 
         self.amount_of_original_data_sent_in_bytes = 0
@@ -38,275 +206,795 @@ class Sender:
         self.number_of_duplicate_acknowledgments_received = 0
         self.number_of_data_segments_dropped = 0
         self.number_of_acknowledgments_dropped = 0
+        self.number_of_parity_segments_sent = 0
+        self.number_of_holes_repaired_by_parity = 0
+        self.number_of_window_probes_sent = 0
 
-        self.retransmit_oldest_unack_flag = 0
-        self.ack_number_of_last_data_packet = -1 
+        self.fin_seq_number = self.next_seq_num
         self.dupackcounter = 0
+        self.sack_requested = sack
+        self.sack_enabled = False
+        self.highest_sacked_seq_number = None
+        self.number_of_sacked_segments_in_window = 0
+
+        self.congestion_control = congestion_control
+        self.congestion_controller = None
+        self.cwnd_log_filename = cwnd_log_filename
+        self.recovery_seq_number = None
+        self.last_congestion_event_time = 0.0
 
         self.sliding_window = OrderedDict() 
 
-        self.sliding_window_lock = threading.Lock()
+        self.tracer = tracer
+        self.ack_latency = Histogram(ACK_LATENCY_BUCKETS)
+
+    @property
+    def rto(self):
+        return self.rto_estimator.rto
 
     def log_message(self, direction, time, type, sequence_number, length): 
-        with open(self.log_filename, 'a') as file:  
-            file.write(f"{direction}    {round(time*1000,2)}    {type}  {sequence_number}   {length}\n")
+        self.logger.log(direction, time, type, sequence_number, length)
 
     def create_packet(self, type, seq_number, data): 
         """ Helper function to create a packet based on the type """
-        header = type.to_bytes(2, byteorder='big') + seq_number.to_bytes(2, byteorder='big')
-        return header + data
+        return self.header.pack(type, seq_number) + data
+
+    def syn_options(self):
+        options = {}
+        if self.sack_requested:
+            options[OPTION_SACK_PERMITTED] = b''
+        if self.header is V2:
+            options[OPTION_MSS] = self.mss.to_bytes(4, 'big')
+            options[OPTION_WINDOW_SCALE] = b'\x00'
+        if self.stripe is not None:
+            transfer_id, offset, _ = self.stripe
+            options[OPTION_STRIPE] = encode_stripe(transfer_id, offset, os.path.getsize(self.filename))
+        elif self.resume_requested and self.header is V2:
+            options[OPTION_RESUME] = encode_resume(*self.file_identity())
+        if self.fec_requested and self.header is V2:
+            options[OPTION_FEC] = b''
+        if self.compression_level is not None and self.header is V2:
+            options[OPTION_COMPRESSION] = bytes(supported_algorithms())
+        return options
+
+    def file_identity(self):
+        """ (size, token) naming this version of the input file, so a receiver never resumes a different one """
+        status = os.stat(self.filename)
+        token = zlib.crc32(f"{os.path.basename(self.filename)}:{status.st_size}:{status.st_mtime_ns}".encode())
+        return status.st_size, token
+
+    def apply_negotiated_options(self, packet):
+        """ Adopts the receiver's answer to the SYN options: SACK, MSS and its scaled window """
+        _, _, window = self.header.unpack(packet)
+        options = decode_options(packet[self.header.size:])
+        if self.stripe is not None and OPTION_STRIPE not in options:
+            raise RuntimeError("the receiver does not support striped transfers")
+        self.sack_enabled = self.sack_requested and OPTION_SACK_PERMITTED in options
+        if OPTION_MSS in options:
+            self.mss = max(1, min(self.mss, int.from_bytes(options[OPTION_MSS], 'big')))
+        else:
+            self.mss = min(self.mss, DEFAULT_MSS)
+        window_bytes = self.max_window_size
+        if window is not None and OPTION_WINDOW_SCALE in options:
+            self.peer_window_scale = options[OPTION_WINDOW_SCALE][0]
+            window_bytes = min(window_bytes, window << self.peer_window_scale)
+            self.receive_window = window_bytes
+            if self.mss_is_default:
+                self.mss = min(self.mss, default_mss_for(window_bytes))
+        if self.fec_requested and OPTION_FEC in options:
+            self.mss = min(self.mss, MAX_MSS - PARITY_LAYOUT.size)
+            self.parity_encoder = ParityEncoder()
+            if self.fec_block_size is None:
+                self.block_size_controller = BlockSizeController()
+        self.max_win = max(1, window_bytes // self.mss)
+        self.congestion_controller = create_congestion_controller(self.congestion_control, self.max_win,
+                                                                 self.cwnd_log_filename is not None)
+        resume = decode_resume(options[OPTION_RESUME]) if self.resume_requested and OPTION_RESUME in options else None
+        if resume is not None:
+            self.resume_enabled = True
+            self.resume_offset = min(resume[0], os.path.getsize(self.filename))
+        if self.compression_level is not None and len(options.get(OPTION_COMPRESSION, b'')) == 1:
+            if options[OPTION_COMPRESSION][0] in supported_algorithms():
+                self.compression_algorithm = options[OPTION_COMPRESSION][0]
+
+    def queue_datagram(self, datagram):
+        """ Outbound channel delivery: the datagram goes out with this event loop iteration's burst """
+        header, payload = datagram
+        packet_type, seq_number, _ = self.header.unpack(header)
+        self.pending_datagrams.append(datagram)
+        self.log_message("snd", (time.time() - self.start_time), PACKET_TYPE_NAMES[packet_type], seq_number,
+                         len(payload) if packet_type in (DATA, PARITY) else 0)
+
+    def log_dropped_datagram(self, datagram):
+        header, payload = datagram
+        packet_type, seq_number, _ = self.header.unpack(header)
+        self.log_message("drp", (time.time() - self.start_time), PACKET_TYPE_NAMES[packet_type], seq_number,
+                         len(payload) if packet_type in (DATA, PARITY) else 0)
+        if packet_type == DATA:
+            self.number_of_data_segments_dropped += 1
+
+    def log_dropped_ack(self, packet):
+        ack_type, ack_seq_number, _ = self.header.unpack(packet)
+        self.log_message("drp", (time.time() - self.start_time), PACKET_TYPE_NAMES.get(ack_type, "ACK"), ack_seq_number,
+                         len(packet) - self.header.size)
+        self.number_of_acknowledgments_dropped += 1
+
+    def send_through_channel(self, header, payload):
+        self.outbound.submit((header, payload), len(header) + len(payload))
+
+    def next_channel_deadline(self):
+        deadlines = [deadline for deadline in (self.outbound.next_deadline(), self.inbound.next_deadline()) if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def exchange_control_segment(self, type, seq_number, payload, max_attempts=None):
+        """ Sends a SYN or FIN until its ACK arrives, retransmitting after each RTO.
+
+        Returns the ACK, or None once max_attempts segments went unanswered. An attempt whose
+        segment or reply was dropped by the simulated impairment is retried without counting
+        against max_attempts, so flp and rlp cannot fail the handshake by themselves. Runs on
+        the blocking socket, so held datagrams are released between timed receives.
+        """
+        header = self.header.pack(type, seq_number)
+        expected_ack = (seq_number + 1) % self.seq_modulus
+        acks = []
+        self.inbound.deliver = acks.append
+        attempts = 0
+        transmissions = 0
+        try:
+            while max_attempts is None or attempts < max_attempts:
+                attempts += 1
+                transmissions += 1
+                drops = self.outbound.number_of_datagrams_dropped + self.inbound.number_of_datagrams_dropped
+                sent_at = time.monotonic()
+                deadline = sent_at + self.rto
+                self.send_through_channel(header, payload)
+                while True:
+                    now = time.monotonic()
+                    self.outbound.release(now)
+                    self.inbound.release(now)
+                    self.flush_pending_datagrams()
+                    for packet in acks:
+                        ack_type, ack_seq_number, _ = self.header.unpack(packet)
+                        self.log_message("rcv", (time.time() - self.start_time), "ACK", ack_seq_number, 0)
+                        if ack_type == ACK and ack_seq_number == expected_ack:
+                            if transmissions == 1:
+                                self.rto_estimator.add_sample(time.monotonic() - sent_at)
+                            return packet
+                    acks.clear()
+                    if now >= deadline:
+                        break
+                    channel_deadline = self.next_channel_deadline()
+                    wait = min(deadline, channel_deadline or deadline) - now
+                    if wait <= 0:
+                        continue
+                    self.sender_socket.settimeout(wait)
+                    try:
+                        packet, _ = self.sender_socket.recvfrom(RECV_BUFFER_SIZE)
+                    except TimeoutError:
+                        continue
+                    self.inbound.submit(packet, len(packet))
+                if self.outbound.number_of_datagrams_dropped + self.inbound.number_of_datagrams_dropped > drops:
+                    attempts -= 1
+                self.rto_estimator.backoff()
+            return None
+        finally:
+            self.outbound.clear()
+            self.inbound.clear()
+            self.inbound.deliver = self.handle_ack
+            self.sender_socket.settimeout(None)
 
     def connection_setup(self):
         """ Handles sending SYN, FIN segments """
-
-        syn_packet = self.create_packet(SYN, self.isn, b'')
-
         self.start_time = time.time()
-        while(True):
-            try: 
-
-                if random.random() > self.flp:
-                    self.sender_socket.sendto(syn_packet, self.receiver_address)
-
-                    self.log_message("snd", (time.time() - self.start_time), "SYN", self.isn, 0) 
-                else:
-                    self.log_message("drp", (time.time() - self.start_time), "SYN", self.isn, 0) 
-
-                    self.rto_timer1 = threading.Timer(self.rto, lambda: None) 
-                    self.rto_timer1.start() 
-                    self.rto_timer1.join()  
-                    self.rto_timer1.cancel()
-                    continue
-                self.sender_socket.settimeout(self.rto) 
-
-                packet, _ = self.sender_socket.recvfrom(4) 
-
-                ack_type, ack_seq_number = int.from_bytes(packet[0:2], 'big'), int.from_bytes(packet[2:4], 'big')
-
-                ack_seq_number = ack_seq_number % 65536
-                if random.random() > self.rlp:
-                    self.log_message("rcv", (time.time() - self.start_time), "ACK", ack_seq_number, 0)  
-                    if ack_type == ACK and ack_seq_number == self.isn + 1:
-
-                        break 
-
-                else: 
-                    self.log_message("drp", (time.time() - self.start_time), "ACK", ack_seq_number, 0)
-
-                    self.rto_timer2 = threading.Timer(self.rto, lambda: None) 
-
-                    self.rto_timer2.start() 
-                    self.rto_timer2.join() 
-                    self.rto_timer2.cancel()
-            except TimeoutError:
+        syn_ack = self.exchange_control_segment(SYN, self.isn, encode_options(self.syn_options()), MAX_SYN_ATTEMPTS)
+        if syn_ack is None:
+            raise RuntimeError(f"no answer from the receiver after {MAX_SYN_ATTEMPTS} SYN attempts")
+        self.apply_negotiated_options(syn_ack)
+
+    def transmit_segment(self, seq_number, segment, retransmission=False):
+        """ Sends one DATA segment through the impaired channel and updates the counters """
+        data = segment.data
+        segment.sent_at = time.monotonic()
+        segment.retransmitted = segment.retransmitted or retransmission
+        timeout = min(self.rto_estimator.max_rto, self.rto * (2 ** segment.timeouts))
+        self.retransmission_timers.schedule(seq_number, segment.sent_at + timeout)
+        self.send_through_channel(segment.header, data)
+        if retransmission:
+            self.number_of_retransmitted_data_segments += 1
+        else:
+            self.amount_of_original_data_sent_in_bytes += len(data)
+            self.number_of_original_data_segments_sent += 1
+
+    def flush_pending_datagrams(self):
+        """ Sends every segment queued during this event loop iteration as one burst """
+        if self.pending_datagrams:
+            started = self.tracer.start("send") if self.tracer is not None else None
+            self.batch_sender.send_burst(self.pending_datagrams, self.receiver_address)
+            if started is not None:
+                self.tracer.finish("send", started, datagrams=len(self.pending_datagrams))
+            self.pending_datagrams = []
+
+    def current_block_size(self):
+        """ Data segments per parity: fixed, or adapted to the measured loss rate, and never more than a window """
+        if self.block_size_controller is not None:
+            block_size = self.block_size_controller.block_size()
+        else:
+            block_size = self.fec_block_size
+        return max(1, min(block_size, self.max_win))
+
+    def add_to_parity_block(self, seq_number, data):
+        self.parity_encoder.add(seq_number, data)
+        if len(self.parity_encoder) >= self.current_block_size():
+            self.send_parity()
+
+    def send_parity(self):
+        """ Sends the PARITY segment of the open block, once; a lost parity is not retransmitted """
+        parity = self.parity_encoder.finish()
+        if parity is None:
+            return
+        seq_number, payload = parity
+        self.parity_block_ends.append(self.next_seq_num)
+        self.send_through_channel(self.header.pack(PARITY, seq_number), payload)
+        self.number_of_parity_segments_sent += 1
+
+    def parity_may_repair(self, seq_number):
+        """ Whether a parity segment can still rebuild the hole at seq_number, so its retransmission can wait.
+
+        A hole in the block still being filled gets that block's parity sent right away. A sent
+        parity has had its chance once the receiver SACKs data sent after it; without SACK there
+        is no telling, and the hole is retransmitted as usual.
+        """
+        if self.parity_encoder is None:
+            return False
+        hole_offset = (seq_number - self.prev_ack_seq_num) % self.seq_modulus
+        for block_end in self.parity_block_ends:
+            block_end_offset = (block_end - self.prev_ack_seq_num) % self.seq_modulus
+            if block_end_offset > hole_offset:
+                return self.sack_enabled and self.highest_sacked_offset() <= block_end_offset
+        self.send_parity()
+        return self.sack_enabled
+
+    def forget_acknowledged_blocks(self):
+        in_flight_bytes = (self.next_seq_num - self.prev_ack_seq_num) % self.seq_modulus
+        while self.parity_block_ends and not 0 < (self.parity_block_ends[0] - self.prev_ack_seq_num) % self.seq_modulus <= in_flight_bytes:
+            self.parity_block_ends.popleft()
+
+    def in_flight_segments(self):
+        """ Segments sent but neither cumulatively acknowledged nor SACKed """
+        return len(self.sliding_window) - self.number_of_sacked_segments_in_window
+
+    def receive_window_is_full(self):
+        """ Whether another full segment would overrun the window the receiver last advertised """
+        return (self.next_seq_num - self.prev_ack_seq_num) % self.seq_modulus + self.mss > self.receive_window
+
+    def can_send_new_segment(self):
+        """ The effective window is the smaller of the congestion window and the receiver's window """
+        return (len(self.sliding_window) < self.max_win
+                and self.in_flight_segments() < self.congestion_controller.window()
+                and not self.receive_window_is_full())
+
+    def update_persist_timer(self):
+        """ Arms the zero-window probe when only the receiver's window holds back new data and no ACK is due """
+        if self.sliding_window or self.all_data_has_been_read_from_file_flag or not self.receive_window_is_full():
+            self.persist_deadline = None
+            self.persist_backoffs = 0
+        elif self.persist_deadline is None:
+            self.persist_deadline = time.monotonic() + self.persist_interval()
+
+    def persist_interval(self):
+        return min(self.rto * (2 ** self.persist_backoffs), max(1.0, self.rto))
+
+    def handle_persist_timer(self):
+        """ Sends an empty DATA segment, which the receiver answers with an ACK carrying its current window """
+        if self.persist_deadline is None or time.monotonic() < self.persist_deadline:
+            return
+        self.send_through_channel(self.header.pack(DATA, self.next_seq_num), b'')
+        self.number_of_window_probes_sent += 1
+        self.persist_backoffs += 1
+        self.persist_deadline = time.monotonic() + self.persist_interval()
+
+    def fill_window(self):
+        """ Reads and sends new segments until the window is full or the file is exhausted """
+        while self.can_send_new_segment() and not self.all_data_has_been_read_from_file_flag:
+            file_data = self.read_segment_payload()
+            if not file_data:
+                break
+
+            seq_number = self.next_seq_num
+            segment = Segment(self.header.pack(DATA, seq_number), file_data)
+            self.sliding_window[seq_number] = segment
+            self.next_seq_num = (self.next_seq_num + len(file_data)) % self.seq_modulus
+            self.transmit_segment(seq_number, segment)
+            if self.parity_encoder is not None:
+                self.add_to_parity_block(seq_number, file_data)
+
+        if self.all_data_has_been_read_from_file_flag:
+            if self.parity_encoder is not None:
+                self.send_parity()
+            self.fin_seq_number = self.next_seq_num
+            if not self.sliding_window:
+                self.connection_teardown_event.set()
+
+    def read_segment_payload(self):
+        """ The next MSS of the stream: a slice of the mapped file, or of the framed compressed blocks """
+        if self.compressor is not None:
+            file_data = self.compressor.read(self.mss)
+            if self.compressor.finished:
+                self.all_data_has_been_read_from_file_flag = 1
+            return file_data
+        file_data = self.file_view[self.file_offset:self.file_offset + self.mss]
+        self.file_offset += len(file_data)
+        if self.file_offset >= len(self.file_view):
+            self.all_data_has_been_read_from_file_flag = 1
+        return file_data
+
+    def retransmit_oldest_unacknowledged_segment(self):
+        for seq_number, segment in self.sliding_window.items():
+            if not segment.sacked:
+                self.transmit_segment(seq_number, segment, retransmission=True)
+                return
+
+    def mark_sacked_segments(self, blocks):
+        """ Marks window segments covered by the receiver's SACK blocks as delivered and stops their timers """
+        in_flight_bytes = (self.next_seq_num - self.prev_ack_seq_num) % self.seq_modulus
+        ranges = []
+        for start, end in blocks:
+            start_offset = (start - self.prev_ack_seq_num) % self.seq_modulus
+            end_offset = (end - self.prev_ack_seq_num) % self.seq_modulus
+            if 0 < start_offset < end_offset <= in_flight_bytes:
+                ranges.append((start_offset, end_offset))
+        if not ranges:
+            return
+
+        highest_end_offset = max(end_offset for _, end_offset in ranges)
+        if self.highest_sacked_seq_number is None or highest_end_offset > self.highest_sacked_offset():
+            self.highest_sacked_seq_number = (self.prev_ack_seq_num + highest_end_offset) % self.seq_modulus
+
+        for seq_number, segment in self.sliding_window.items():
+            segment_offset = (seq_number - self.prev_ack_seq_num) % self.seq_modulus
+            if segment_offset >= highest_end_offset:
+                break
+            if segment.sacked:
                 continue
-
-    def timeout_thread(self):
-        if (self.sliding_window != {}): 
-            if (list(self.sliding_window.keys())[0] == self.oldest_unacknowledged_segment_seqno): 
-                self.retransmit_oldest_unack_flag = 1
-                self.dupackcounter = 0  
-
-    def send_thread(self):
-
-        self.sender_socket.settimeout(None) 
-        with open(self.filename, 'rb') as file: 
-
-            count1 = 0 
-            while not self.connection_teardown_event.is_set(): 
-
-                while ((len(self.sliding_window) < self.max_win) and (self.all_data_has_been_read_from_file_flag == 0)): 
-                    count1 = count1 + 1
-                    file_data = file.read(MSS)
-                    if (count1 == 1):
-                        self.prev_ack_seq_num = (self.isn + 1) 
-
-                    if len(file_data) < MSS: 
-                        self.all_data_has_been_read_from_file_flag = 1
-                        self.ack_number_of_last_data_packet = self.next_seq_num              
-                        self.ack_number_of_last_data_packet = self.ack_number_of_last_data_packet % 65536 
-                        self.length_of_data_of_last_packet = len(file_data) 
-
-                    packet = self.create_packet(DATA, self.next_seq_num, file_data)
-
-                    self.sliding_window[self.next_seq_num] = file_data 
-                    self.next_seq_num = (self.next_seq_num + len(file_data)) % 65536  
-                    if random.random() > self.flp:
-                        self.sender_socket.sendto(packet, self.receiver_address)
-
-                        self.log_message("snd", (time.time() - self.start_time), "DATA", int.from_bytes(packet[2:4]), len(packet[4:]))  
-                        self.amount_of_original_data_sent_in_bytes += len(packet[4:])
-                        self.number_of_original_data_segments_sent += 1
-                    else:
-                        self.log_message("drp", (time.time() - self.start_time), "DATA", int.from_bytes(packet[2:4]), len(packet[4:])) 
-
-                        self.all_data_has_been_read_from_file_flag = 0 
-                        self.number_of_data_segments_dropped = self.number_of_data_segments_dropped + 1
-                        self.amount_of_original_data_sent_in_bytes += len(packet[4:])
-                        self.number_of_original_data_segments_sent += 1
-
-                if self.timeout_timer.is_alive():
-                    self.timeout_timer.join()  
-                    self.timeout_timer.cancel()
-
-                if (self.sliding_window != {}): 
-
-                    self.oldest_unacknowledged_segment_seqno = list(self.sliding_window.keys())[0]
-
-                    self.timeout_timer = threading.Timer(self.rto, self.timeout_thread)
-
-                    self.timeout_timer.start()
-                    self.timeout_timer.join()  
-
-    def recv_thread(self):
-
-        while not self.connection_teardown_event.is_set():
-
-            packet, _ = self.sender_socket.recvfrom(MSS) 
-            current_ack_seq_no = (int.from_bytes(packet[2:4])) % 65536
-            if random.random() > self.rlp:
-                self.log_message("rcv", (time.time() - self.start_time), "ACK", int.from_bytes(packet[2:4]), len(packet[4:])) 
-
-                if (current_ack_seq_no == self.ack_number_of_last_data_packet): 
-
-                    self.amount_of_original_data_acknowledged_in_bytes += (current_ack_seq_no - self.prev_ack_seq_num) + self.length_of_data_of_last_packet
-
-                    self.connection_teardown_event.set() 
-                    continue              
-                elif (current_ack_seq_no == self.prev_ack_seq_num):
-                    self.dupackcounter = self.dupackcounter + 1
-
-                    self.number_of_duplicate_acknowledgments_received = self.number_of_duplicate_acknowledgments_received + 1
-                    if(self.dupackcounter == 4): 
-                        self.retransmit_oldest_unack_flag = 1 
-
-                        self.dupackcounter = 0 
-
-                elif (current_ack_seq_no != self.prev_ack_seq_num): 
-
-                    target_item = current_ack_seq_no
-
-                    keys = list(self.sliding_window.keys())
-
-                    for key in keys:
-                        if key == target_item:
-                            break
-                        del self.sliding_window[key]
-
-                    self.dupackcounter = 0 
-
-                    self.amount_of_original_data_acknowledged_in_bytes += (current_ack_seq_no - self.prev_ack_seq_num)
-                    self.prev_ack_seq_num = current_ack_seq_no
-
-                else:
-                    pass
-
+            segment_end_offset = segment_offset + len(segment.data)
+            if any(start_offset <= segment_offset and segment_end_offset <= end_offset for start_offset, end_offset in ranges):
+                segment.sacked = True
+                self.number_of_sacked_segments_in_window += 1
+                self.retransmission_timers.cancel(seq_number)
             else:
-                self.log_message("drp", (time.time() - self.start_time), "ACK", int.from_bytes(packet[2:4]), len(packet[4:])) 
+                segment.reported_missing = True
+
+    def highest_sacked_offset(self):
+        if self.highest_sacked_seq_number is None:
+            return 0
+        offset = (self.highest_sacked_seq_number - self.prev_ack_seq_num) % self.seq_modulus
+        return offset if offset <= (self.next_seq_num - self.prev_ack_seq_num) % self.seq_modulus else 0
+
+    def retransmit_sack_holes(self):
+        """ Resends the unsacked segments below the highest SACKed byte; repeat losses are left to their timers """
+        highest_offset = self.highest_sacked_offset()
+        if highest_offset == 0:
+            self.retransmit_oldest_unacknowledged_segment()
+            return
+        for seq_number, segment in self.sliding_window.items():
+            if (seq_number - self.prev_ack_seq_num) % self.seq_modulus >= highest_offset:
+                break
+            if not segment.sacked and not segment.retransmitted and not self.parity_may_repair(seq_number):
+                self.transmit_segment(seq_number, segment, retransmission=True)
+
+    def handle_expired_timers(self):
+        """ Retransmits every segment whose own timer has expired; each segment backs off independently """
+        expired = self.retransmission_timers.pop_expired(time.monotonic())
+        if not expired:
+            return
+        started = self.tracer.start("retransmit") if self.tracer is not None else None
+        self.dupackcounter = 0
+        congestion_detected = False
+        flight_size = self.in_flight_segments()
+        for seq_number in expired:
+            segment = self.sliding_window.get(seq_number)
+            if segment is not None:
+                congestion_detected = congestion_detected or segment.sent_at >= self.last_congestion_event_time
+                segment.timeouts += 1
+                self.transmit_segment(seq_number, segment, retransmission=True)
+        if congestion_detected:
+            self.congestion_controller.on_timeout(flight_size)
+            self.recovery_seq_number = None
+            self.last_congestion_event_time = time.monotonic()
+        if started is not None:
+            self.tracer.finish("retransmit", started, cause="timeout", segments=len(expired))
+
+    def start_fast_recovery(self):
+        """ Third duplicate ACK: reduce the congestion window once per window of data and resend the holes """
+        if self.sliding_window and next(iter(self.sliding_window.values())).sent_at >= self.last_congestion_event_time:
+            self.congestion_controller.enter_recovery(self.in_flight_segments())
+            self.recovery_seq_number = self.next_seq_num
+            self.last_congestion_event_time = time.monotonic()
+        self.retransmit_holes()
+
+    def retransmit_holes(self):
+        started = self.tracer.start("retransmit") if self.tracer is not None else None
+        if self.sack_enabled:
+            self.retransmit_sack_holes()
+        else:
+            self.retransmit_oldest_unacknowledged_segment()
+        if started is not None:
+            self.tracer.finish("retransmit", started, cause="holes")
+
+    def handle_ack(self, packet):
+        ack_type, current_ack_seq_no, window = self.header.unpack(packet)
+        previous_receive_window = self.receive_window
+        if self.peer_window_scale is not None:
+            self.receive_window = window << self.peer_window_scale
+        ack_payload = packet[self.header.size:]
+        ack_label = "SACK" if ack_type == SACK else "ACK"
+        self.log_message("rcv", (time.time() - self.start_time), ack_label, current_ack_seq_no, len(ack_payload))
+
+        if current_ack_seq_no == self.prev_ack_seq_num:
+            window_update = self.receive_window != previous_receive_window or (ack_type == ACK and ack_payload)
+            if self.sliding_window and ack_type == SACK:
+                self.mark_sacked_segments(decode_sack_blocks(ack_payload, self.header.seq_bytes))
+            if self.sliding_window and not window_update:
+                next(iter(self.sliding_window.values())).reported_missing = True
+                self.dupackcounter += 1
+                self.number_of_duplicate_acknowledgments_received += 1
+                if self.congestion_controller.in_recovery:
+                    self.congestion_controller.on_recovery_dupack()
+                    if self.sack_enabled and self.dupackcounter % DUP_ACK_THRESHOLD == 0:
+                        self.retransmit_sack_holes()
+                elif self.dupackcounter >= DUP_ACK_THRESHOLD and not self.parity_may_repair(self.prev_ack_seq_num):
+                    self.dupackcounter = 0
+                    self.start_fast_recovery()
+            return
+
+        acked_bytes = (current_ack_seq_no - self.prev_ack_seq_num) % self.seq_modulus
+        in_flight_bytes = (self.next_seq_num - self.prev_ack_seq_num) % self.seq_modulus
+        if acked_bytes > in_flight_bytes:
+            return
+
+        recovery_completed = (self.recovery_seq_number is not None
+                              and acked_bytes >= (self.recovery_seq_number - self.prev_ack_seq_num) % self.seq_modulus)
+        acked_segments = 0
+        newest_acked_segment = None
+        acked_a_retransmission = False
+        while self.sliding_window:
+            seq_number = next(iter(self.sliding_window))
+            if seq_number == current_ack_seq_no:
+                break
+            newest_acked_segment = self.sliding_window.pop(seq_number)
+            self.retransmission_timers.cancel(seq_number)
+            acked_segments += 1
+            if newest_acked_segment.sacked:
+                self.number_of_sacked_segments_in_window -= 1
+            acked_a_retransmission = acked_a_retransmission or newest_acked_segment.retransmitted
+            if self.parity_encoder is not None:
+                self.observe_parity_outcome(newest_acked_segment)
+
+        if newest_acked_segment is not None and not acked_a_retransmission:
+            ack_latency = time.monotonic() - newest_acked_segment.sent_at
+            self.rto_estimator.add_sample(ack_latency)
+            self.ack_latency.observe(ack_latency)
+            self.congestion_controller.update_rtt(self.rto_estimator.srtt)
+        else:
+            self.rto_estimator.reset_backoff()
 
-                self.number_of_acknowledgments_dropped = self.number_of_acknowledgments_dropped + 1
+        self.dupackcounter = 0
+        self.amount_of_original_data_acknowledged_in_bytes += acked_bytes
+        self.prev_ack_seq_num = current_ack_seq_no
+        if self.parity_block_ends:
+            self.forget_acknowledged_blocks()
+        if ack_type == SACK:
+            self.mark_sacked_segments(decode_sack_blocks(ack_payload, self.header.seq_bytes))
+
+        if not self.congestion_controller.in_recovery:
+            self.congestion_controller.on_ack(acked_segments)
+        elif recovery_completed:
+            self.congestion_controller.exit_recovery()
+            self.recovery_seq_number = None
+        else:
+            self.congestion_controller.on_partial_ack(acked_segments)
+            self.retransmit_holes()
+
+        if self.all_data_has_been_read_from_file_flag and not self.sliding_window:
+            self.connection_teardown_event.set()
+
+    def observe_parity_outcome(self, segment):
+        """ Feeds the loss estimate; a hole acknowledged without being retransmitted was rebuilt from parity """
+        if segment.reported_missing and not segment.retransmitted:
+            self.number_of_holes_repaired_by_parity += 1
+        if self.block_size_controller is not None:
+            self.block_size_controller.observe(segment.reported_missing or segment.retransmitted)
+
+    def handle_readable(self):
+        """ Drains every ACK that is currently queued on the non-blocking socket """
+        started = self.tracer.start("receive") if self.tracer is not None else None
+        received = 0
+        while True:
+            datagrams = self.batch_receiver.receive_batch()
+            received += len(datagrams)
+            for packet, _ in datagrams:
+                self.inbound.submit(bytes(packet) if self.inbound.holds_datagrams else packet, len(packet))
+            if len(datagrams) < len(self.batch_receiver.views):
+                break
+        if started is not None:
+            self.tracer.finish("receive", started, datagrams=received)
+
+    def open_input_file(self):
+        """ Maps the input file so window segments are memoryview slices of the page cache, not copies """
+        self.file_offset = self.resume_offset
+        self.file_map = None
+        with open(self.filename, 'rb') as file:
+            if os.fstat(file.fileno()).st_size > 0:
+                self.file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file_view = memoryview(self.file_map if self.file_map is not None else b'')
+        self.whole_file_view = self.file_view
+        if self.stripe is not None:
+            _, offset, length = self.stripe
+            self.file_view = self.whole_file_view[offset:offset + length]
+        if self.compression_algorithm is not None and self.compressor is None:
+            self.compressor = BlockCompressor(self.file_view, self.compression_algorithm, self.compression_level)
+
+    def close_input_file(self):
+        self.file_view.release()
+        self.whole_file_view.release()
+        if self.file_map is not None:
+            self.file_map.close()
+
+    def transfer(self):
+        """ Event loop owning the socket, the retransmission timers and the window """
+        self.prev_ack_seq_num = self.next_seq_num
+        self.sender_socket.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.sender_socket, selectors.EVENT_READ)
+        self.open_input_file()
+        try:
+            self.fill_window()
+            self.flush_pending_datagrams()
+            while not self.connection_teardown_event.is_set():
+                timeout = None
+                deadlines = [deadline for deadline in (self.retransmission_timers.next_deadline(), self.next_channel_deadline(),
+                                                       self.persist_deadline) if deadline is not None]
+                if deadlines:
+                    timeout = max(0, min(deadlines) - time.monotonic())
+                if selector.select(timeout):
+                    self.handle_readable()
+                self.inbound.release()
+                self.handle_expired_timers()
+                self.fill_window()
+                self.update_persist_timer()
+                self.handle_persist_timer()
+                self.outbound.release()
+                self.flush_pending_datagrams()
+        finally:
+            self.outbound.clear()
+            self.inbound.clear()
+            self.pending_datagrams = []
+            self.sliding_window.clear()
+            self.close_input_file()
+        self.retransmission_timers.clear()
+        selector.close()
+        self.sender_socket.setblocking(True)
+
+    def window_limit(self):
+        """ Segments can_send_new_segment allows in flight: the smallest of max_win, cwnd and the advertised window """
+        limit = min(self.max_win, self.receive_window // self.mss)
+        if self.congestion_controller is None:
+            return limit
+        return min(limit, self.congestion_controller.window())
+
+    def register_metrics(self, registry):
+        """ Exposes the transfer counters, window and RTO state and the ACK latency histogram """
+        registry.counter("sender_original_bytes_sent_total", "Original data sent in bytes",
+                         lambda: self.amount_of_original_data_sent_in_bytes)
+        registry.counter("sender_original_bytes_acked_total", "Original data acknowledged in bytes",
+                         lambda: self.amount_of_original_data_acknowledged_in_bytes)
+        registry.counter("sender_original_segments_sent_total", "Original DATA segments sent",
+                         lambda: self.number_of_original_data_segments_sent)
+        registry.counter("sender_retransmitted_segments_total", "DATA segments retransmitted",
+                         lambda: self.number_of_retransmitted_data_segments)
+        registry.counter("sender_duplicate_acks_received_total", "Duplicate ACKs received",
+                         lambda: self.number_of_duplicate_acknowledgments_received)
+        registry.counter("sender_data_segments_dropped_total", "DATA segments dropped by the impairment layer",
+                         lambda: self.number_of_data_segments_dropped)
+        registry.counter("sender_acks_dropped_total", "ACKs dropped by the impairment layer",
+                         lambda: self.number_of_acknowledgments_dropped)
+        registry.counter("sender_parity_segments_sent_total", "PARITY segments sent",
+                         lambda: self.number_of_parity_segments_sent)
+        registry.counter("sender_parity_repaired_holes_total", "Reported holes acknowledged without a retransmission",
+                         lambda: self.number_of_holes_repaired_by_parity)
+        registry.counter("sender_compression_input_bytes_total", "File bytes passed through the block compressor",
+                         lambda: self.compressor.amount_of_input_in_bytes if self.compressor is not None else 0)
+        registry.counter("sender_compression_output_bytes_total", "Framed bytes the block compressor produced",
+                         lambda: self.compressor.amount_of_output_in_bytes if self.compressor is not None else 0)
+        registry.counter("sender_compression_cpu_seconds_total", "CPU time spent compressing blocks",
+                         lambda: self.compressor.cpu_time if self.compressor is not None else 0.0)
+        registry.counter("sender_window_probes_total", "Zero-window probes sent", lambda: self.number_of_window_probes_sent)
+        registry.gauge("sender_receive_window_bytes", "Receive window advertised in the latest ACK", lambda: self.receive_window)
+        registry.gauge("sender_window_segments", "Segments held in the sliding window", lambda: len(self.sliding_window))
+        registry.gauge("sender_window_limit_segments", "Effective window: the smallest of max_win, cwnd and the receiver window",
+                       self.window_limit)
+        registry.gauge("sender_in_flight_bytes", "Bytes sent but not cumulatively acknowledged",
+                       lambda: (self.next_seq_num - getattr(self, "prev_ack_seq_num", self.next_seq_num)) % self.seq_modulus)
+        registry.gauge("sender_cwnd_segments", "Congestion window",
+                       lambda: self.congestion_controller.cwnd if self.congestion_controller is not None else None)
+        registry.gauge("sender_rto_seconds", "Current retransmission timeout", lambda: self.rto)
+        registry.gauge("sender_srtt_seconds", "Smoothed round-trip time", lambda: self.rto_estimator.srtt)
+        registry.gauge("sender_throughput_bytes_per_second", "Acknowledged bytes per second since the previous scrape",
+                       Rate(lambda: self.amount_of_original_data_acknowledged_in_bytes))
+        registry.histogram("sender_ack_latency_seconds", "Time from sending a segment to its cumulative ACK (Karn samples)",
+                           lambda: self.ack_latency)
+        if self.tracer is not None:
+            self.tracer.register_metrics(registry, "sender")
+
+    def format_estimate(self, seconds):
+        return "n/a" if seconds is None else round(seconds * 1000, 2)
+
+    def format_verdict(self, verified, failure):
+        """ Summary wording for a check the receiver reports in the FIN ACK """
+        if verified is None:
+            return "unconfirmed"
+        return "ok" if verified else failure
 
     def connection_teardown(self):
         """ Handles sending FIN segments """
-        fin_packet = self.create_packet(FIN, (self.ack_number_of_last_data_packet) % 65536, b'') 
-        while(True):
-            try:
-
-                if random.random() > self.flp:
-                    self.sender_socket.sendto(fin_packet, self.receiver_address)
-                    self.log_message("snd", (time.time() - self.start_time), "FIN", self.ack_number_of_last_data_packet, 0) 
-                else:
-                    self.log_message("drp", (time.time() - self.start_time), "FIN", self.ack_number_of_last_data_packet, 0) 
-
-                    self.rto_timer = threading.Timer(self.rto, lambda: None)
-
-                    self.rto_timer.start() 
-                    self.rto_timer.join()  
-                    self.rto_timer.cancel()
-                    continue
-                self.sender_socket.settimeout(self.rto) 
-
-                packet, _ = self.sender_socket.recvfrom(4) 
-
-                ack_type, ack_seq_number = int.from_bytes(packet[0:2], 'big'), int.from_bytes(packet[2:4], 'big')
-
-                ack_seq_number = ack_seq_number % 65536
-                if random.random() > self.rlp:
-                    self.log_message("rcv", (time.time() - self.start_time), "ACK", ack_seq_number, 0)  
-                    if ack_type == ACK and ack_seq_number == self.ack_number_of_last_data_packet + 1:
-
-                        self.sender_socket.settimeout(None) 
-                        break 
-
-                else: 
-                    self.log_message("drp", (time.time() - self.start_time), "ACK", ack_seq_number, 0)
-
-                    self.rto_timer = threading.Timer(self.rto, lambda: None)
-
-                    self.rto_timer.start() 
-                    self.rto_timer.join() 
-                    self.rto_timer.cancel()
-            except TimeoutError:
-
-                break 
-
-        with open(self.log_filename, 'a') as file:  
-            file.write(f"Original data sent:  {self.amount_of_original_data_sent_in_bytes}\n")
-            file.write(f"Original data acked: {self.amount_of_original_data_acknowledged_in_bytes}\n")
-            file.write(f"Original segments sent: {self.number_of_original_data_segments_sent}\n")
-            file.write(f"Retransmitted segments: {self.number_of_retransmitted_data_segments}\n")
-            file.write(f"Dup acks received: {self.number_of_duplicate_acknowledgments_received}\n")
-            file.write(f"Data segments dropped: {self.number_of_data_segments_dropped}\n")
-            file.write(f"Ack segments dropped: {self.number_of_acknowledgments_dropped}\n")
+        fin_payload = b''
+        if self.resume_enabled:
+            self.open_input_file()
+            fin_payload = zlib.crc32(self.file_view).to_bytes(4, 'big')
+            self.close_input_file()
+        fin_ack = self.exchange_control_segment(FIN, self.fin_seq_number, fin_payload, MAX_FIN_ATTEMPTS)
+        transfer_time = time.time() - self.start_time
+        if fin_ack is not None and len(fin_ack) > self.header.size:
+            if self.resume_enabled:
+                self.hash_verified = fin_ack[self.header.size] == 1
+            elif self.compressor is not None:
+                self.decompression_verified = fin_ack[self.header.size] == 1
+
+        lines = [
+            f"Original data sent:  {self.amount_of_original_data_sent_in_bytes}",
+            f"Original data acked: {self.amount_of_original_data_acknowledged_in_bytes}",
+            f"Original segments sent: {self.number_of_original_data_segments_sent}",
+            f"Retransmitted segments: {self.number_of_retransmitted_data_segments}",
+            f"Dup acks received: {self.number_of_duplicate_acknowledgments_received}",
+            f"Data segments dropped: {self.number_of_data_segments_dropped}",
+            f"Ack segments dropped: {self.number_of_acknowledgments_dropped}",
+            f"Transfer time (s): {round(transfer_time, 6)}",
+            f"Smoothed RTT (ms): {self.format_estimate(self.rto_estimator.srtt)}",
+            f"RTT variance (ms): {self.format_estimate(self.rto_estimator.rttvar)}",
+            f"RTO (ms): {self.format_estimate(self.rto_estimator.rto)}",
+            f"Header version: {self.header.version}",
+            f"MSS: {self.mss}",
+            f"Congestion control: {self.congestion_controller.name}",
+            f"Zero-window probes sent: {self.number_of_window_probes_sent}",
+            f"Final cwnd (segments): {round(self.congestion_controller.cwnd, 2)}",
+        ]
+        if self.parity_encoder is not None:
+            lines.append(f"Parity segments sent: {self.number_of_parity_segments_sent}")
+            lines.append(f"Retransmissions avoided by parity: {self.number_of_holes_repaired_by_parity}")
+            lines.append(f"Final FEC block size: {self.current_block_size()}")
+            if self.block_size_controller is not None:
+                lines.append(f"Estimated loss rate: {round(self.block_size_controller.loss_rate, 4)}")
+        if self.compressor is not None:
+            lines.append(f"Compression: {ALGORITHM_NAMES[self.compression_algorithm]} level {self.compression_level}")
+            lines.append(f"Compression ratio: {round(self.compressor.ratio, 3)}")
+            lines.append(f"Blocks stored uncompressed: {self.compressor.number_of_stored_blocks} of {self.compressor.number_of_blocks}")
+            lines.append(f"Compression CPU time (s): {round(self.compressor.cpu_time, 3)}")
+            lines.append(f"Decompression: {self.format_verdict(self.decompression_verified, 'failed')}")
+        if self.resume_enabled:
+            lines.append(f"Resumed from offset: {self.resume_offset}")
+            lines.append(f"Hash check: {self.format_verdict(self.hash_verified, 'MISMATCH')}")
+        self.logger.close(lines)
+        if self.cwnd_log_filename is not None:
+            self.congestion_controller.export(self.cwnd_log_filename)
 
         self.sender_socket.close()  
 
-def main():
-    if len(sys.argv) != 8:
-        print("Usage: python sender.py sender_port receiver_port txt_file_to_send max_win rto flp rlp")
-        sys.exit(1)
-
-    sender_port = int(sys.argv[1])
-    receiver_port = int(sys.argv[2])
-    filename = sys.argv[3]
-    max_window_size = int(sys.argv[4])
-    rto = int(sys.argv[5])
-    flp = float(sys.argv[6])
-    rlp = float(sys.argv[7])
-
-    sender = Sender(sender_port, receiver_port, filename, max_window_size, rto, flp, rlp)    
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="sender.py", usage="python sender.py sender_port receiver_port txt_file_to_send max_win rto flp rlp [options]")
+    parser.add_argument("sender_port", type=int)
+    parser.add_argument("receiver_port", type=int)
+    parser.add_argument("txt_file_to_send")
+    parser.add_argument("max_win", type=int)
+    parser.add_argument("rto", type=int)
+    parser.add_argument("flp", type=float)
+    parser.add_argument("rlp", type=float)
+    parser.add_argument("--log-mode", choices=LOG_MODES, default=FULL, help="full event trace, summary counters only, or no log file")
+    parser.add_argument("--sack", action=argparse.BooleanOptionalAction, default=True, help="offer selective acknowledgments in the SYN")
+    parser.add_argument("--cc", choices=sorted(CONGESTION_CONTROLLERS), default="reno", help="congestion control algorithm")
+    parser.add_argument("--cwnd-log", help="write the cwnd/ssthresh time series to this CSV file")
+    parser.add_argument("--mss", type=int, help=f"maximum segment size to propose in the SYN (default max_win / {DEFAULT_SEGMENTS_PER_WINDOW}, at least {DEFAULT_MSS} and at most {MAX_MSS} bytes; {DEFAULT_MSS} with --compat)")
+    parser.add_argument("--compat", action="store_true",
+                        help="use the original 4-byte header with 16-bit sequence numbers (max_win is capped at 32768 bytes)")
+    parser.add_argument("--streams", type=int, default=1,
+                        help="stripe the file over N connections from sender_port..sender_port+N-1 (needs receiver.py --server)")
+    parser.add_argument("--resume", action="store_true", help="continue from the receiver's last checkpoint of this file")
+    parser.add_argument("--fec", action="store_true", help="follow each block of DATA segments with an XOR parity segment")
+    parser.add_argument("--compress", action="store_true", help="send the file as compressed blocks (zstd if installed, else zlib)")
+    parser.add_argument("--compress-level", type=int, default=1, help="compression level; low levels are fast")
+    parser.add_argument("--fec-block", type=int, help="DATA segments per parity segment (default: adapt to the measured loss rate)")
+    add_impairment_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.streams > 1 and args.compat:
+        parser.error("--streams needs the v2 header and cannot be combined with --compat")
+    if args.resume and (args.compat or args.streams > 1):
+        parser.error("--resume needs the v2 header and a single stream")
+    if args.fec and args.compat:
+        parser.error("--fec needs the v2 header and cannot be combined with --compat")
+    if args.compress and (args.compat or args.resume):
+        parser.error("--compress needs the v2 header and cannot be combined with --resume")
+    if args.fec_block is not None and args.fec_block < 1:
+        parser.error("--fec-block must be at least 1")
+    return args
+
+def stripes_of(file_size, streams):
+    """ Splits a file into at most `streams` contiguous (offset, length) chunks """
+    chunk_size = max(1, -(-file_size // streams))
+    return [(offset, min(chunk_size, file_size - offset)) for offset in range(0, file_size, chunk_size)] or [(0, 0)]
+
+def run_sender(sender, args, tracer, index=0):
+    """ Runs one connection, serving its metrics while it lasts when requested """
+    metrics_server = serve_metrics(args, sender, index)
+    try:
+        sender.connection_setup()
+        sender.transfer()
+        sender.connection_teardown()
+        if sender.hash_verified is False:
+            raise RuntimeError("the receiver's copy does not match the file")
+        if sender.decompression_verified is False:
+            raise RuntimeError("the receiver could not decompress the data")
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        if tracer is not None:
+            tracer.close()
+
+def send_stripe(args, index, stripe):
+    """ Process pool task: sends one stripe over its own connection and returns the bytes acknowledged """
+    tracer = create_tracer(args)
+    sender = Sender(args.sender_port + index, args.receiver_port, args.txt_file_to_send, args.max_win, args.rto, args.flp, args.rlp,
+                    log_mode=args.log_mode, sack=args.sack, congestion_control=args.cc, mss=args.mss, compat=args.compat,
+                    stripe=stripe, log_filename=f"sender_log_{index}.txt",
+                    forward_impairment=create_impairment(args, args.flp, f"forward-{index}"),
+                    reverse_impairment=create_impairment(args, args.rlp, f"reverse-{index}"),
+                    tracer=tracer, fec=args.fec, fec_block_size=args.fec_block,
+                    compression_level=args.compress_level if args.compress else None)
+
+    run_sender(sender, args, tracer, index)
+    return sender.amount_of_original_data_acknowledged_in_bytes
+
+def send_striped(args):
+    """ Sends each stripe of the file from its own process; the receiver writes them at their offsets """
+    transfer_id = random.getrandbits(64)
+    stripes = stripes_of(os.path.getsize(args.txt_file_to_send), args.streams)
+    with ProcessPoolExecutor(max_workers=len(stripes)) as pool:
+        futures = [pool.submit(send_stripe, args, index, (transfer_id, offset, length))
+                   for index, (offset, length) in enumerate(stripes)]
+        for future in futures:
+            future.result()
 
-    sender.connection_setup()
-
-    send  = threading.Thread(target = sender.send_thread)
-    receive = threading.Thread(target = sender.recv_thread)
-    send.start()
-    receive.start()
-
-    while not sender.connection_teardown_event.is_set():
-
-        while (sender.retransmit_oldest_unack_flag == 1):
-
-            if (sender.sliding_window != {}): 
-                oldest_unacked_packet_seqno = (list(sender.sliding_window.keys())[0]) % 65536
-                oldest_unacked_packet_data = sender.sliding_window[oldest_unacked_packet_seqno]
-                packet = sender.create_packet(DATA, oldest_unacked_packet_seqno, oldest_unacked_packet_data)
-                if random.random() > sender.flp:
-                    sender.sender_socket.sendto(packet, sender.receiver_address)
-
-                    sender.log_message("snd", (time.time() - sender.start_time), "DATA", int.from_bytes(packet[2:4]), len(packet[4:]))  
-                    sender.number_of_retransmitted_data_segments = sender.number_of_retransmitted_data_segments + 1
-                else:
-                    sender.log_message("drp", (time.time() - sender.start_time), "DATA", int.from_bytes(packet[2:4]), len(packet[4:])) 
-
-                    sender.number_of_retransmitted_data_segments = sender.number_of_retransmitted_data_segments + 1
-                    sender.number_of_data_segments_dropped += 1
-                sender.retransmit_oldest_unack_flag = 0 
-
-    send.join()
-    receive.join()
-
-    sender.connection_teardown()
+def main():
+    args = parse_arguments(sys.argv[1:])
+    try:
+        send(args)
+    except RuntimeError as error:
+        sys.exit(f"sender.py: error: {error}")
+
+def send(args):
+    if args.streams > 1:
+        send_striped(args)
+        return
+
+    tracer = create_tracer(args)
+    sender = Sender(args.sender_port, args.receiver_port, args.txt_file_to_send, args.max_win, args.rto, args.flp, args.rlp,
+                    log_mode=args.log_mode, sack=args.sack, congestion_control=args.cc, cwnd_log_filename=args.cwnd_log,
+                    mss=args.mss, compat=args.compat,
+                    forward_impairment=create_impairment(args, args.flp, "forward"),
+                    reverse_impairment=create_impairment(args, args.rlp, "reverse"),
+                    tracer=tracer, resume=args.resume, fec=args.fec, fec_block_size=args.fec_block,
+                    compression_level=args.compress_level if args.compress else None)
+
+    run_sender(sender, args, tracer)
 
 if __name__ == "__main__": 
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import ACK, OPTION_MSS, OPTION_SACK_PERMITTED, OPTION_WINDOW_SCALE, V2, encode_options
+from segment_logger import OFF
+from sender import Sender
+
+@pytest.fixture
+def make_sender(tmp_path):
+    """ Builds Senders past the SYN exchange, with the input file mapped; their ACKs are fed to handle_ack directly """
+    senders = []
+
+    def make(content=b'x' * 20000, max_window_size=8000, mss=1000, sack=True):
+        input_file = tmp_path / "in.bin"
+        input_file.write_bytes(content)
+        sender = Sender(0, 0, str(input_file), max_window_size, 50, 0, 0, log_mode=OFF, sack=sack, mss=mss,
+                        log_filename=str(tmp_path / "sender_log.txt"))
+        options = {OPTION_MSS: mss.to_bytes(4, 'big'), OPTION_WINDOW_SCALE: b'\x00'}
+        if sack:
+            options[OPTION_SACK_PERMITTED] = b''
+        sender.apply_negotiated_options(V2.pack(ACK, sender.isn + 1, max_window_size) + encode_options(options))
+        sender.start_time = time.time()
+        sender.prev_ack_seq_num = sender.next_seq_num
+        sender.open_input_file()
+        senders.append(sender)
+        return sender
+
+    yield make
+    for sender in senders:
+        sender.sliding_window.clear()
+        sender.pending_datagrams = []
+        sender.close_input_file()
+        sender.sender_socket.close()
@@ -0,0 +1,58 @@
+""" Framed block compression and its stream decoder """
+
+import os
+
+import pytest
+
+from block_compression import (COMPRESSED, FRAME_LAYOUT, STORED, ZLIB, BlockCompressor, FrameDecoder, choose_algorithm,
+                               supported_algorithms)
+
+def framed_stream(content, block_size, segment_size=1000):
+    compressor = BlockCompressor(memoryview(content), ZLIB, block_size=block_size)
+    segments = []
+    while not compressor.finished:
+        segments.append(compressor.read(segment_size))
+    return compressor, segments
+
+def decode(segments):
+    decoder = FrameDecoder(ZLIB)
+    blocks = []
+    for segment in segments:
+        blocks.extend(decoder.feed(segment))
+    return decoder, b''.join(blocks)
+
+def test_compressible_blocks_round_trip_across_segment_boundaries():
+    content = b'the quick brown fox ' * 5000
+    compressor, segments = framed_stream(content, block_size=16384)
+    assert all(len(segment) == 1000 for segment in segments[:-1])
+    assert compressor.number_of_blocks == 7 and compressor.number_of_stored_blocks == 0
+    assert compressor.ratio > 10
+
+    decoder, decoded = decode(segments)
+    assert decoded == content
+    assert not decoder.partial_frame
+
+def test_incompressible_blocks_are_stored():
+    content = os.urandom(40000)
+    compressor, segments = framed_stream(content, block_size=16384)
+    assert compressor.number_of_stored_blocks == compressor.number_of_blocks == 3
+    assert b''.join(segments)[0] == STORED
+    assert decode(segments)[1] == content
+
+def test_an_unfinished_frame_is_reported_as_partial():
+    _, segments = framed_stream(b'a' * 100000, block_size=65536, segment_size=10)
+    decoder = FrameDecoder(ZLIB)
+    assert decoder.feed(segments[0]) == []
+    assert decoder.partial_frame
+
+def test_a_corrupt_block_or_unknown_kind_raises_value_error():
+    corrupt = b'not a zlib stream'
+    with pytest.raises(ValueError, match="corrupt zlib block"):
+        FrameDecoder(ZLIB).feed(FRAME_LAYOUT.pack(COMPRESSED, len(corrupt)) + corrupt)
+    with pytest.raises(ValueError, match="unknown frame kind 9"):
+        FrameDecoder(ZLIB).feed(FRAME_LAYOUT.pack(9, 1) + b'x')
+
+def test_the_first_supported_offered_algorithm_is_chosen():
+    assert choose_algorithm([ZLIB]) == ZLIB
+    assert choose_algorithm([99]) is None
+    assert supported_algorithms()[-1] == ZLIB
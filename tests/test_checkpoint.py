@@ -0,0 +1,122 @@
+""" Checkpoints of resumable transfers, and a receiver connection that sees its sender reconnect """
+
+import os
+import zlib
+
+from protocol import (ACK, DATA, FIN, OPTION_MSS, OPTION_RESUME, SYN, V2, decode_options, decode_resume, encode_options,
+                      encode_resume)
+from receiver import Checkpoint, ReceiverConnection, file_crc32
+from segment_logger import OFF, SegmentLogger
+
+MSS = 1000
+TOKEN = 0x1234
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, packet, address):
+        self.sent.append(packet)
+
+def open_connection(tmp_path, checkpoint_interval=3000):
+    logger = SegmentLogger(str(tmp_path / "receiver_log.txt"), OFF)
+    receiver_socket = RecordingSocket()
+    connection = ReceiverConnection(receiver_socket, ('localhost', 1), str(tmp_path / "out.bin"), 64000, logger,
+                                    ack_every=1, checkpoint_interval=checkpoint_interval)
+    return connection, receiver_socket
+
+def syn(connection, isn, file_size, resume=True, token=TOKEN):
+    options = {OPTION_MSS: MSS.to_bytes(4, 'big')}
+    if resume:
+        options[OPTION_RESUME] = encode_resume(file_size, token)
+    connection.handle_packet(V2.pack(SYN, isn) + encode_options(options))
+    syn_ack = connection.receiver_socket.sent[-1]
+    assert V2.unpack(syn_ack)[:2] == (ACK, isn + 1)
+    return decode_options(syn_ack[V2.size:])
+
+def send_data(connection, isn, data):
+    for start in range(0, len(data), MSS):
+        connection.handle_packet(V2.pack(DATA, isn + 1 + start) + data[start:start + MSS])
+
+def fin(connection, seq_number, payload=b''):
+    connection.handle_packet(V2.pack(FIN, seq_number) + payload)
+    return connection.receiver_socket.sent[-1]
+
+def test_checkpoint_round_trip(tmp_path):
+    output = tmp_path / "out.bin"
+    output.write_bytes(b'a' * 5000)
+    checkpoint = Checkpoint(str(output))
+    checkpoint.save(TOKEN, 10000, 4000, zlib.crc32(b'a' * 4000))
+    assert checkpoint.load(TOKEN, 10000) == (4000, zlib.crc32(b'a' * 4000))
+    assert checkpoint.load(TOKEN + 1, 10000) == (0, 0)
+    assert checkpoint.load(TOKEN, 10001) == (0, 0)
+    checkpoint.remove()
+    assert checkpoint.load(TOKEN, 10000) == (0, 0)
+
+def test_checkpoint_rejects_a_damaged_or_short_prefix(tmp_path):
+    output = tmp_path / "out.bin"
+    output.write_bytes(b'a' * 4000)
+    checkpoint = Checkpoint(str(output))
+    checkpoint.save(TOKEN, 10000, 4000, zlib.crc32(b'a' * 4000))
+    output.write_bytes(b'a' * 1000 + b'b' + b'a' * 2999)
+    assert checkpoint.load(TOKEN, 10000) == (0, 0)
+    output.write_bytes(b'a' * 3000)
+    assert checkpoint.load(TOKEN, 10000) == (0, 0)
+
+def test_file_crc32_reads_a_prefix(tmp_path):
+    output = tmp_path / "out.bin"
+    output.write_bytes(b'abcdef')
+    assert file_crc32(str(output), 4) == zlib.crc32(b'abcd')
+    assert file_crc32(str(output), 7) is None
+
+def test_reconnect_resumes_from_the_committed_offset(tmp_path):
+    content = os.urandom(10000)
+    connection, _ = open_connection(tmp_path)
+    syn(connection, 100, len(content))
+    send_data(connection, 100, content[:7500])
+
+    resumed = decode_resume(syn(connection, 5000, len(content))[OPTION_RESUME])
+    assert resumed == (7500, zlib.crc32(content[:7500]))
+    send_data(connection, 5000, content[7500:])
+    fin_ack = fin(connection, 5001 + len(content) - 7500, zlib.crc32(content).to_bytes(4, 'big'))
+
+    assert fin_ack[-1] == 1
+    assert (tmp_path / "out.bin").read_bytes() == content
+    assert not os.path.exists(str(tmp_path / "out.bin.ckpt"))
+
+def test_reconnect_with_another_file_starts_over(tmp_path):
+    content = os.urandom(10000)
+    connection, _ = open_connection(tmp_path)
+    syn(connection, 100, len(content), token=TOKEN + 1)
+    send_data(connection, 100, os.urandom(7500))
+
+    assert decode_resume(syn(connection, 5000, len(content))[OPTION_RESUME]) == (0, 0)
+    send_data(connection, 5000, content)
+    fin_ack = fin(connection, 5001 + len(content), zlib.crc32(content).to_bytes(4, 'big'))
+
+    assert fin_ack[-1] == 1
+    assert (tmp_path / "out.bin").read_bytes() == content
+
+def test_reconnect_without_resume_starts_the_file_over(tmp_path):
+    content = os.urandom(5000)
+    connection, _ = open_connection(tmp_path)
+    syn(connection, 100, len(content), resume=False)
+    send_data(connection, 100, content[:3000])
+    syn(connection, 5000, len(content), resume=False)
+    send_data(connection, 5000, content)
+    fin(connection, 5001 + len(content))
+
+    assert (tmp_path / "out.bin").read_bytes() == content
+
+def test_hash_check_reads_the_file_on_disk(tmp_path):
+    content = os.urandom(10000)
+    connection, _ = open_connection(tmp_path)
+    syn(connection, 100, len(content))
+    send_data(connection, 100, content)
+    connection.file_writer.flush()
+    os.pwrite(connection.file_writer.fd, b'\0', 10)
+
+    fin_ack = fin(connection, 101 + len(content), zlib.crc32(content).to_bytes(4, 'big'))
+
+    assert fin_ack[-1] == 0
+    assert connection.hash_verified is False
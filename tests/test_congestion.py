@@ -0,0 +1,94 @@
+""" Congestion controllers, and the window limits they share with the sender """
+
+import pytest
+
+from congestion import INITIAL_WINDOW, CongestionController, Cubic, FixedWindow, NewReno, create_congestion_controller
+from protocol import ACK, V2
+from segment_logger import OFF
+from sender import Sender
+
+def test_slow_start_grows_by_one_segment_per_acked_segment_up_to_the_maximum():
+    controller = NewReno(100)
+    assert controller.cwnd == INITIAL_WINDOW
+    controller.on_ack(5)
+    assert controller.cwnd == INITIAL_WINDOW + 5
+    controller.on_ack(1000)
+    assert controller.cwnd == 100
+
+def test_congestion_avoidance_adds_one_segment_per_window():
+    controller = NewReno(100)
+    controller.ssthresh = 10.0
+    controller.on_ack(10)
+    assert controller.cwnd == pytest.approx(11.0)
+
+def test_fast_recovery_halves_the_window_and_inflates_on_duplicate_acks():
+    controller = NewReno(100, record_history=True)
+    controller.cwnd = 20.0
+    controller.enter_recovery(20)
+    assert (controller.ssthresh, controller.cwnd, controller.in_recovery) == (10.0, 13.0, True)
+    controller.on_recovery_dupack()
+    assert controller.cwnd == 14.0
+    assert controller.history[-1][1:] == ("recovery_dupack", 14.0, 10.0)
+    controller.on_partial_ack(3)
+    assert controller.cwnd == 12.0
+    controller.exit_recovery()
+    assert (controller.cwnd, controller.in_recovery) == (10.0, False)
+
+def test_timeout_collapses_the_window_to_one_segment():
+    controller = NewReno(100)
+    controller.cwnd = 16.0
+    controller.on_timeout(16)
+    assert (controller.cwnd, controller.ssthresh) == (1.0, 8.0)
+
+def test_history_is_kept_only_when_requested_and_only_on_changes():
+    assert NewReno(100).history == []
+    controller = NewReno(10, record_history=True)
+    controller.on_ack(5)
+    controller.on_ack(5)
+    assert [event for _, event, _, _ in controller.history] == ["init"]
+
+def test_cubic_reduces_by_beta_and_regrows_towards_the_previous_maximum():
+    controller = Cubic(1000)
+    controller.cwnd = 100.0
+    controller.enter_recovery(100)
+    assert controller.ssthresh == pytest.approx(70.0)
+    controller.exit_recovery()
+    controller.update_rtt(0.01)
+    for _ in range(50):
+        controller.on_ack(10)
+    assert 70.0 < controller.cwnd <= 1000
+
+def test_fixed_window_ignores_losses():
+    controller = create_congestion_controller("none", 40)
+    controller.on_timeout(40)
+    controller.enter_recovery(40)
+    assert controller.window() == 40
+
+def test_controllers_must_define_congestion_avoidance():
+    with pytest.raises(TypeError):
+        CongestionController(10)
+    assert {NewReno, Cubic, FixedWindow} <= {type(create_congestion_controller(name, 10)) for name in ("reno", "cubic", "none")}
+
+def test_compat_window_fits_half_the_16_bit_sequence_space(tmp_path):
+    input_file = tmp_path / "in.bin"
+    input_file.write_bytes(b'x' * 1000)
+    sender = Sender(0, 0, str(input_file), 50000, 50, 0, 0, log_mode=OFF, compat=True,
+                    log_filename=str(tmp_path / "sender_log.txt"))
+    sender.sender_socket.close()
+    assert sender.max_window_size == 32768
+    assert sender.max_win * sender.mss <= 32768
+
+def test_same_number_acks_that_move_the_window_are_not_duplicates(make_sender):
+    sender = make_sender(max_window_size=8000, mss=1000)
+    sender.fill_window()
+    for window in (2000, 4000, 6000, 8000):
+        sender.handle_ack(V2.pack(ACK, sender.prev_ack_seq_num, window))
+    assert sender.receive_window == 8000
+    assert sender.number_of_duplicate_acknowledgments_received == 0
+    assert sender.number_of_retransmitted_data_segments == 0
+    assert not sender.congestion_controller.in_recovery
+
+    for _ in range(3):
+        sender.handle_ack(V2.pack(ACK, sender.prev_ack_seq_num, 8000))
+    assert sender.number_of_duplicate_acknowledgments_received == 3
+    assert sender.congestion_controller.in_recovery
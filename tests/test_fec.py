@@ -0,0 +1,79 @@
+""" XOR parity encoding, loss repair and the adaptive block size """
+
+import os
+
+import pytest
+
+from fec import BlockSizeController, ParityDecoder, ParityEncoder, probability_of_multiple_losses, xor_of
+from protocol import decode_parity, encode_parity
+
+SEGMENTS = [os.urandom(100), os.urandom(100), os.urandom(100), os.urandom(60)]
+SEQ_NUMBERS = [1000, 1100, 1200, 1300]
+
+def encoded_block():
+    encoder = ParityEncoder()
+    for seq_number, data in zip(SEQ_NUMBERS, SEGMENTS):
+        encoder.add(seq_number, data)
+    return encoder.finish()
+
+def test_xor_pads_short_segments_with_zeros():
+    assert xor_of([b'\x01\x02', b'\x03'], 3) == b'\x02\x02\x00'
+    assert xor_of([b'abc', b'abc'], 3) == b'\x00' * 3
+
+def test_encoder_emits_one_parity_per_block_and_starts_over():
+    encoder = ParityEncoder()
+    assert encoder.finish() is None
+    first_seq_number, payload = encoded_block()
+    assert first_seq_number == 1000
+    assert decode_parity(payload) == (4, 100, 360, xor_of(SEGMENTS, 100))
+
+def test_malformed_parity_is_rejected():
+    assert decode_parity(encode_parity(0, 100, 0, b'\x00' * 100)) is None
+    assert decode_parity(encode_parity(2, 100, 250, b'\x00' * 100)) is None
+    assert decode_parity(encode_parity(2, 100, 150, b'\x00' * 99)) is None
+
+def test_decoder_rebuilds_a_single_lost_segment():
+    decoder = ParityDecoder(2 ** 32, 10000)
+    decoder.remember(1000, SEGMENTS[0])
+    assert decoder.add(*encoded_block())
+    buffered = {1200: SEGMENTS[2], 1300: SEGMENTS[3]}
+
+    assert decoder.recover(1100, buffered.get) == [(1100, SEGMENTS[1])]
+    assert len(decoder) == 0
+
+def test_decoder_rebuilds_a_short_last_segment():
+    decoder = ParityDecoder(2 ** 32, 10000)
+    for seq_number, data in zip(SEQ_NUMBERS[:3], SEGMENTS[:3]):
+        decoder.remember(seq_number, data)
+    decoder.add(*encoded_block())
+    assert decoder.recover(1300, {}.get) == [(1300, SEGMENTS[3])]
+
+def test_decoder_keeps_a_block_missing_two_segments():
+    decoder = ParityDecoder(2 ** 32, 10000)
+    decoder.remember(1000, SEGMENTS[0])
+    decoder.add(*encoded_block())
+    buffered = {1300: SEGMENTS[3]}
+
+    assert decoder.recover(1100, buffered.get) == []
+    assert len(decoder) == 1
+    buffered[1200] = SEGMENTS[2]
+    assert decoder.recover(1100, buffered.get) == [(1100, SEGMENTS[1])]
+
+def test_decoder_drops_a_block_whose_segments_were_forgotten():
+    decoder = ParityDecoder(2 ** 32, 150)
+    for seq_number, data in zip(SEQ_NUMBERS[:3], SEGMENTS[:3]):
+        decoder.remember(seq_number, data)
+    decoder.add(*encoded_block())
+    assert decoder.recover(1300, {}.get) == []
+    assert len(decoder) == 0
+
+def test_block_size_shrinks_as_the_loss_rate_grows():
+    controller = BlockSizeController()
+    assert controller.block_size() == controller.max_block_size
+    for index in range(5000):
+        controller.observe(lost=index % 100 == 0)
+    assert controller.loss_rate == pytest.approx(0.01, abs=0.01)
+    block_size = controller.block_size()
+    assert controller.min_block_size < block_size < controller.max_block_size
+    assert probability_of_multiple_losses(block_size + 1, controller.loss_rate) <= controller.target_probability
+    assert probability_of_multiple_losses(block_size + 2, controller.loss_rate) > controller.target_probability
@@ -0,0 +1,29 @@
+""" SYN and FIN retransmission in Sender.exchange_control_segment """
+
+from protocol import SYN
+from sender import RtoEstimator
+
+class DropFirst:
+    """ Impairment that drops the first count datagrams and passes the rest at once """
+
+    holds_datagrams = False
+
+    def __init__(self, count):
+        self.count = count
+
+    def delivery_times(self, now, size):
+        if self.count:
+            self.count -= 1
+            return []
+        return [now]
+
+def test_segments_dropped_by_the_impairment_do_not_count_as_attempts(make_sender):
+    sender = make_sender()
+    sender.rto_estimator = RtoEstimator(0.001, max_rto=0.001)
+    sender.outbound.impairment = DropFirst(10)
+    sent = []
+    sender.outbound.deliver = sent.append
+
+    assert sender.exchange_control_segment(SYN, sender.isn, b'', max_attempts=3) is None
+    assert sender.outbound.number_of_datagrams_dropped == 10
+    assert len(sent) == 3
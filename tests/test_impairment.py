@@ -0,0 +1,61 @@
+""" Loss models, Impairment delivery times and the ImpairedChannel that applies them """
+
+import random
+
+import pytest
+
+from impairment import BernoulliLoss, GilbertElliottLoss, ImpairedChannel, Impairment
+
+def loss_pattern(model, count):
+    return [model.drops() for _ in range(count)]
+
+def test_bernoulli_loss_is_reproducible_from_its_seed_and_hits_its_rate():
+    pattern = loss_pattern(BernoulliLoss(0.2, random.Random(7)), 20000)
+    assert pattern == loss_pattern(BernoulliLoss(0.2, random.Random(7)), 20000)
+    assert sum(pattern) / len(pattern) == pytest.approx(0.2, abs=0.01)
+    assert not any(loss_pattern(BernoulliLoss(0.0, random.Random(7)), 1000))
+
+def test_gilbert_elliott_loss_has_the_requested_mean_and_burst_length():
+    model = GilbertElliottLoss.with_mean_loss(0.1, 4, random.Random(3))
+    pattern = loss_pattern(model, 100000)
+    assert pattern == loss_pattern(GilbertElliottLoss.with_mean_loss(0.1, 4, random.Random(3)), 100000)
+    assert sum(pattern) / len(pattern) == pytest.approx(0.1, abs=0.01)
+
+    bursts = [len(run) for run in ''.join('x' if lost else ' ' for lost in pattern).split()]
+    assert sum(bursts) / len(bursts) == pytest.approx(4, rel=0.1)
+
+def test_delivery_times_add_delay_bandwidth_and_duplicates():
+    impairment = Impairment(delay=0.01, bandwidth=8000, rng=random.Random(1))
+    assert impairment.delivery_times(0.0, 100) == [pytest.approx(0.11)]
+    assert impairment.delivery_times(0.0, 100) == [pytest.approx(0.21)]
+
+    assert Impairment(duplicate=1.0).delivery_times(5.0, 100) == [5.0, 5.0]
+    assert Impairment(loss=BernoulliLoss(1.0, random.Random(1))).delivery_times(5.0, 100) == []
+
+def test_channel_releases_held_datagrams_in_release_order_and_reports_drops():
+    delivered = []
+    dropped = []
+    impairment = Impairment(delay=0.05)
+    channel = ImpairedChannel(impairment, delivered.append, dropped.append)
+
+    impairment.delay = 0.2
+    channel.submit("slow", 10)
+    impairment.delay = 0.1
+    channel.submit("fast", 10)
+    impairment.loss = BernoulliLoss(1.0, random.Random(1))
+    channel.submit("lost", 10)
+
+    assert delivered == [] and dropped == ["lost"]
+    assert channel.number_of_datagrams_dropped == 1
+    channel.release(channel.next_deadline())
+    assert delivered == ["fast"]
+    channel.release(channel.next_deadline())
+    assert delivered == ["fast", "slow"]
+    assert channel.next_deadline() is None
+
+def test_channel_without_delay_delivers_at_once():
+    delivered = []
+    channel = ImpairedChannel(Impairment(duplicate=1.0), delivered.append)
+    channel.submit("datagram", 10)
+    assert delivered == ["datagram", "datagram"]
+    assert channel.number_of_datagrams_duplicated == 1 and len(channel) == 0
@@ -0,0 +1,24 @@
+""" Tracer buffering and the sender's effective-window gauge """
+
+import json
+
+from metrics import Tracer
+
+def test_tracer_writes_records_once_its_buffer_fills(tmp_path):
+    trace_file = tmp_path / "trace.jsonl"
+    tracer = Tracer(str(trace_file), sample_every=1, buffer_size=3, flush_interval=3600)
+    for index in range(5):
+        tracer.finish("span", tracer.start("span"), index=index)
+    assert [json.loads(line)["index"] for line in trace_file.read_text().splitlines()] == [0, 1, 2]
+    assert len(tracer.records) == 2
+
+    tracer.close()
+    assert [json.loads(line)["index"] for line in trace_file.read_text().splitlines()] == [0, 1, 2, 3, 4]
+    assert tracer.records == []
+
+def test_window_limit_includes_the_advertised_window(make_sender):
+    sender = make_sender(max_window_size=8000, mss=1000)
+    sender.congestion_controller.cwnd = 6.0
+    assert sender.window_limit() == 6
+    sender.receive_window = 3500
+    assert sender.window_limit() == 3
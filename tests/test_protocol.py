@@ -0,0 +1,38 @@
+""" V1 and V2 headers, SYN options and window scaling """
+
+from protocol import (ACK, DATA, MAX_WINDOW_SCALE, OPTION_MSS, OPTION_WINDOW_SCALE, SYN, V1, V2, decode_options, encode_options,
+                      header_format_of, window_scale_for)
+from sender import DEFAULT_MSS, DEFAULT_SEGMENTS_PER_WINDOW, default_mss_for
+
+def test_v1_header_has_16_bit_sequence_numbers_and_no_window():
+    packet = V1.pack(DATA, 65535, 5000)
+    assert len(packet) == V1.size == 4
+    assert V1.unpack(packet) == (DATA, 65535, None)
+
+def test_v2_header_carries_a_32_bit_sequence_number_and_a_16_bit_window():
+    packet = V2.pack(ACK, 4294967295, 70000)
+    assert len(packet) == V2.size == 8
+    assert V2.unpack(packet) == (ACK, 4294967295, 0xFFFF)
+
+def test_header_version_is_detected_from_the_first_byte():
+    assert header_format_of(V2.pack(SYN, 1)) is V2
+    assert header_format_of(V1.pack(SYN, 1)) is V1
+    assert header_format_of(b'') is V1
+
+def test_options_round_trip_and_a_truncated_option_is_ignored():
+    options = {OPTION_MSS: (1460).to_bytes(4, 'big'), OPTION_WINDOW_SCALE: b'\x03'}
+    encoded = encode_options(options)
+    assert decode_options(encoded) == options
+    assert decode_options(encoded[:-1]) == {OPTION_MSS: (1460).to_bytes(4, 'big')}
+
+def test_window_scale_is_the_smallest_shift_that_fits_16_bits():
+    assert window_scale_for(65535) == 0
+    assert window_scale_for(65536) == 1
+    assert (1000000 >> window_scale_for(1000000)) <= 0xFFFF
+    assert window_scale_for(1 << 40) == MAX_WINDOW_SCALE
+
+def test_default_mss_keeps_many_segments_in_the_window():
+    assert default_mss_for(5000) == DEFAULT_MSS
+    assert default_mss_for(16000) == DEFAULT_MSS
+    assert default_mss_for(20000) == 1250
+    assert default_mss_for(1000000) == 1000000 // DEFAULT_SEGMENTS_PER_WINDOW
@@ -0,0 +1,39 @@
+""" Out-of-order segments in the receiver's reorder buffer """
+
+from receiver import ReorderBuffer
+
+def test_buffered_segments_are_released_once_contiguous():
+    buffer = ReorderBuffer(65536, 10000)
+    buffer.reset(0)
+    assert buffer.insert(2000, b'c' * 1000)
+    assert buffer.insert(1000, b'b' * 1000)
+    assert buffer.insert(4000, b'e' * 1000)
+    assert buffer.blocks() == [(1000, 3000), (4000, 5000)]
+    assert buffer.advance(1000) == [b'b' * 1000, b'c' * 1000]
+    assert buffer.base_seq_number == 3000
+    assert len(buffer) == 1
+
+def test_duplicates_stale_and_out_of_window_segments_are_refused():
+    buffer = ReorderBuffer(65536, 10000)
+    buffer.reset(5000)
+    assert buffer.insert(6000, b'x' * 1000)
+    assert not buffer.insert(6000, b'x' * 1000)
+    assert not buffer.insert(5000, b'x' * 1000)
+    assert not buffer.insert(4000, b'x' * 1000)
+    assert not buffer.insert(15000, b'x' * 1000)
+
+def test_sequence_numbers_wrap_around():
+    buffer = ReorderBuffer(65536, 10000)
+    buffer.reset(64536)
+    assert buffer.insert(0, b'b' * 1000)
+    assert buffer.insert(65000, b'a' * 536)
+    assert buffer.get(0) == b'b' * 1000
+    assert buffer.blocks() == [(65000, 1000)]
+    assert buffer.advance(65000) == [b'a' * 536, b'b' * 1000]
+    assert buffer.base_seq_number == 1000
+
+def test_acceptance_window_is_capped_at_half_the_sequence_space():
+    buffer = ReorderBuffer(65536, 50000)
+    assert buffer.acceptance_window == 32768
+    buffer.reset(0)
+    assert not buffer.insert(40000, b'x')
@@ -0,0 +1,37 @@
+""" Per-segment retransmission deadlines """
+
+from sender import RetransmissionTimers
+
+def test_expired_segments_come_out_oldest_first():
+    timers = RetransmissionTimers()
+    timers.schedule(300, 3.0)
+    timers.schedule(100, 1.0)
+    timers.schedule(200, 2.0)
+    assert timers.next_deadline() == 1.0
+    assert timers.pop_expired(2.5) == [100, 200]
+    assert len(timers) == 1
+    assert timers.next_deadline() == 3.0
+
+def test_cancelled_segments_never_expire():
+    timers = RetransmissionTimers()
+    timers.schedule(100, 1.0)
+    timers.schedule(200, 2.0)
+    timers.cancel(100)
+    assert timers.next_deadline() == 2.0
+    assert timers.pop_expired(5.0) == [200]
+    assert timers.next_deadline() is None
+
+def test_rescheduling_replaces_the_deadline():
+    timers = RetransmissionTimers()
+    timers.schedule(100, 1.0)
+    timers.schedule(100, 4.0)
+    assert timers.pop_expired(2.0) == []
+    assert timers.pop_expired(4.0) == [100]
+
+def test_stale_entries_are_compacted():
+    timers = RetransmissionTimers()
+    for round in range(100):
+        timers.schedule(1, float(round))
+    assert len(timers.heap) <= 2 * len(timers) + 64
+    assert timers.pop_expired(98.0) == []
+    assert timers.pop_expired(99.0) == [1]
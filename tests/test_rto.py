@@ -0,0 +1,51 @@
+""" RFC 6298 RTO estimation, and Karn's rule in the sender """
+
+import pytest
+
+from protocol import ACK, V2
+from sender import RtoEstimator
+
+def test_first_sample_sets_srtt_and_half_of_it_as_rttvar():
+    estimator = RtoEstimator(0.05)
+    estimator.add_sample(0.1)
+    assert estimator.srtt == pytest.approx(0.1)
+    assert estimator.rttvar == pytest.approx(0.05)
+    assert estimator.rto == pytest.approx(0.1 + 4 * 0.05)
+
+def test_later_samples_are_smoothed():
+    estimator = RtoEstimator(0.01)
+    estimator.add_sample(0.1)
+    estimator.add_sample(0.2)
+    assert estimator.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert estimator.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+
+def test_rto_never_drops_below_the_configured_one():
+    estimator = RtoEstimator(0.05)
+    for _ in range(20):
+        estimator.add_sample(0.001)
+    assert estimator.rto == pytest.approx(0.05)
+
+def test_backoff_doubles_up_to_the_maximum_and_a_sample_clears_it():
+    estimator = RtoEstimator(1.0, max_rto=5.0)
+    estimator.backoff()
+    estimator.backoff()
+    assert estimator.rto == pytest.approx(4.0)
+    estimator.backoff()
+    estimator.backoff()
+    assert estimator.rto == pytest.approx(5.0)
+    estimator.add_sample(0.5)
+    assert estimator.backoffs == 0
+
+def test_acknowledged_retransmission_gives_no_sample(make_sender):
+    sender = make_sender()
+    sender.fill_window()
+    first = next(iter(sender.sliding_window))
+    sender.sliding_window[first].retransmitted = True
+    sender.rto_estimator.backoff()
+
+    sender.handle_ack(V2.pack(ACK, (first + 1000) % sender.seq_modulus, 8000))
+    assert sender.rto_estimator.srtt is None
+    assert sender.rto_estimator.backoffs == 0
+
+    sender.handle_ack(V2.pack(ACK, (first + 2000) % sender.seq_modulus, 8000))
+    assert sender.rto_estimator.srtt is not None
@@ -0,0 +1,40 @@
+""" SACK blocks on the wire and the sender's use of them """
+
+from protocol import (MAX_SACK_BLOCKS, OPTION_SACK_PERMITTED, SACK, V2, decode_options, decode_sack_blocks, encode_options,
+                      encode_sack_blocks)
+
+def test_blocks_round_trip_with_16_and_32_bit_sequence_numbers():
+    blocks = [(1000, 2000), (65000, 464)]
+    assert decode_sack_blocks(encode_sack_blocks(blocks)) == blocks
+    wide_blocks = [(4294960000, 1000), (5000, 7000)]
+    assert decode_sack_blocks(encode_sack_blocks(wide_blocks, 4), 4) == wide_blocks
+
+def test_at_most_max_sack_blocks_are_sent_and_a_truncated_block_is_ignored():
+    blocks = [(index * 10, index * 10 + 5) for index in range(MAX_SACK_BLOCKS + 3)]
+    assert len(decode_sack_blocks(encode_sack_blocks(blocks))) == MAX_SACK_BLOCKS
+    assert decode_sack_blocks(encode_sack_blocks([(1, 2), (3, 4)])[:-1]) == [(1, 2)]
+
+def test_sack_permitted_option_round_trips():
+    assert decode_options(encode_options({OPTION_SACK_PERMITTED: b''})) == {OPTION_SACK_PERMITTED: b''}
+
+def sack(sender, ack_offset, blocks):
+    base = sender.prev_ack_seq_num
+    wrap = sender.seq_modulus
+    return (V2.pack(SACK, (base + ack_offset) % wrap, 8000)
+            + encode_sack_blocks([((base + start) % wrap, (base + end) % wrap) for start, end in blocks], 4))
+
+def test_sacked_segments_stop_their_timers_and_holes_are_resent_once(make_sender):
+    sender = make_sender()
+    sender.fill_window()
+    base = sender.prev_ack_seq_num
+    for _ in range(3):
+        sender.handle_ack(sack(sender, 0, [(2000, 5000)]))
+
+    sacked = [offset for offset in range(0, 8000, 1000) if sender.sliding_window[(base + offset) % sender.seq_modulus].sacked]
+    assert sacked == [2000, 3000, 4000]
+    assert (base + 2000) % sender.seq_modulus not in sender.retransmission_timers.deadlines
+    assert sender.number_of_retransmitted_data_segments == 2
+
+    for _ in range(3):
+        sender.handle_ack(sack(sender, 0, [(2000, 6000)]))
+    assert sender.number_of_retransmitted_data_segments == 2
@@ -0,0 +1,57 @@
+""" ReceiverServer keeps serving the other transfers when one connection's output file fails """
+
+import errno
+import time
+
+from protocol import DATA, FIN, SYN, V2
+from receiver import ReceiverServer
+from segment_logger import OFF
+
+def make_server(tmp_path):
+    return ReceiverServer(0, str(tmp_path / "out.bin"), 20000, log_mode=OFF, log_filename=str(tmp_path / "receiver_log.txt"))
+
+def start_transfer(server, address, isn, content):
+    server.handle_datagram(V2.pack(SYN, isn), address)
+    server.handle_datagram(V2.pack(DATA, isn + 1) + content, address)
+    return server.connections[address]
+
+def failing_write(pending):
+    raise OSError(errno.ENOSPC, "No space left on device")
+
+def test_a_failed_write_evicts_only_its_own_connection(tmp_path):
+    server = make_server(tmp_path)
+    try:
+        failing = start_transfer(server, ('127.0.0.1', 40001), 100, b'a' * 500)
+        healthy = start_transfer(server, ('127.0.0.1', 40002), 200, b'b' * 500)
+        failing.file_writer.write_pending = failing_write
+
+        server.handle_datagram(V2.pack(FIN, 601), ('127.0.0.1', 40001))
+        assert ('127.0.0.1', 40001) not in server.connections
+        assert server.number_of_connections_failed == 1
+        assert failing.file_writer is None
+        assert "No space left on device" in failing.summary_lines()[-1]
+
+        server.handle_datagram(V2.pack(FIN, 701), ('127.0.0.1', 40002))
+        assert healthy.connection_teardown_flag and healthy.output_error is None
+        assert (tmp_path / "out_127.0.0.1_40002_200.bin").read_bytes() == b'b' * 500
+    finally:
+        server.shutdown()
+
+def test_an_idle_writer_is_flushed_without_waiting_and_a_failure_evicts_it(tmp_path):
+    server = make_server(tmp_path)
+    try:
+        connection = start_transfer(server, ('127.0.0.1', 40003), 300, b'c' * 500)
+        connection.last_activity -= 2
+        server.sweep_connections(time.monotonic())
+        server.writer_thread.wait_for(connection.file_writer)
+        assert (tmp_path / "out_127.0.0.1_40003_300.bin").read_bytes() == b'c' * 500
+
+        connection.file_writer.write(b'd' * 500)
+        connection.file_writer.write_pending = failing_write
+        server.sweep_connections(time.monotonic())
+        server.writer_thread.wait_for(connection.file_writer)
+        server.sweep_connections(time.monotonic())
+        assert server.connections == {}
+        assert server.number_of_connections_failed == 1
+    finally:
+        server.shutdown()
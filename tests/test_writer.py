@@ -0,0 +1,32 @@
+""" StreamingFileWriter, alone and sharing one WriterThread """
+
+import os
+
+from receiver import StreamingFileWriter, WriterThread
+
+def test_writes_in_order_without_a_thread(tmp_path):
+    file_writer = StreamingFileWriter(str(tmp_path / "out.bin"), flush_threshold=4)
+    for index in range(10):
+        file_writer.write(bytes([index]) * 3)
+    file_writer.close()
+    assert (tmp_path / "out.bin").read_bytes() == b''.join(bytes([index]) * 3 for index in range(10))
+
+def test_writers_share_one_thread_started_on_demand(tmp_path):
+    writer_thread = WriterThread()
+    file_writers = [StreamingFileWriter(str(tmp_path / f"out{index}.bin"), flush_threshold=1000, writer_thread=writer_thread)
+                    for index in range(3)]
+    contents = [os.urandom(10000) for _ in file_writers]
+    for file_writer, content in zip(file_writers, contents):
+        file_writer.write(content[:10])
+    assert writer_thread.thread is None
+
+    for start in range(10, 10000, 100):
+        for file_writer, content in zip(file_writers, contents):
+            file_writer.write(content[start:start + 100])
+    for file_writer in file_writers:
+        file_writer.close()
+        assert file_writer.backlog_bytes == 0
+    writer_thread.close()
+
+    for index, content in enumerate(contents):
+        assert (tmp_path / f"out{index}.bin").read_bytes() == content